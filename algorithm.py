@@ -1,7 +1,17 @@
-from typing import Tuple, List, Union
+from typing import Tuple, List, Dict, Union
 from copy import copy
+from concurrent.futures import ProcessPoolExecutor
 import data
+from statistics import NormalDist
 import math
+import bisect
+import random
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 """
@@ -15,15 +25,83 @@ CITATIONS:
 """
 
 
+# The default distance between two neighbouring scores in the p-value score distribution
+GRANULARITY = 0.01
+
+# The most prefixes of the pattern search() may enumerate for its filter
+FILTER_LIMIT = 10000
+
+# Whether numpy is installed, which is needed for the dense backend of the weighted pattern
+NUMPY = np is not None
+
+
 class WeightedPattern:
-    def __init__(self, length: int) -> None:
+    def __init__(self, length: int, dense: bool = False) -> None:
         """
-        Initialize a weighted pattern with a given length
+        Initialize a weighted pattern with a given length.
+        A dense weighted pattern keeps its weights in a 2-D numpy array with a row for every data entry,
+        instead of a dict of lists.
 
         :param length: the ammount of position indices in the weighted pattern
+        :param dense: whether to use the numpy array backend
         """
+        if dense and not NUMPY:
+            raise ImportError("The dense backend of WeightedPattern requires numpy")
         self.length = length
+        self.dense = dense
         self.matrix = {}
+        # Slices share the rows of the weighted pattern they were taken from (their base), starting at an offset.
+        # Rows are only ever added after the others, so a slice only keeps how many rows it has (its height)
+        self.offset = 0
+        self.view = False
+        self.base = self
+        self.height = None
+        # The row index of every data entry. Dense backend: the rows themselves in an array,
+        # which has room for more rows than it holds, so adding a row rarely reallocates it.
+        self.index = {}
+        self.array = np.empty((4, length)) if dense else None
+
+    # The rows of the dense backend that are in use
+    @property
+    def weights(self) -> object:
+        """
+        Return the weights of the dense backend as an array of shape (data entries, length).
+
+        :return: a numpy array
+        """
+        return self.base.array[:self.size(), self.offset:self.offset + self.length]
+
+    # Return the amount of data entries that have a row in the weighted pattern
+    def size(self) -> int:
+        """
+        Return the amount of data entries of the weighted pattern, the size of the alphabet of citation 1.
+
+        :return: the amount of data entries
+        """
+        return len(self.index) if self.height is None else self.height
+
+    # Return the row of a data entry
+    def row(self, info: object) -> int:
+        """
+        Return the row index of a data entry, raising a KeyError if it has no row in the weighted pattern.
+
+        :param info: an Entry instance, see data.py
+        :return: the row index
+        """
+        row = self.index[info]
+        if self.height is not None and row >= self.height:
+            raise KeyError(info)
+        return row
+
+    # Return the data entries that have a row in the weighted pattern
+    def symbols(self) -> List[object]:
+        """
+        Return the data entries of the weighted pattern, the alphabet of citation 1.
+        Their order matches the rows of the dense backend.
+
+        :return: a list of data entries
+        """
+        return list(islice(self.index, self.size()))
 
     # Add a new row for a given data entry
     def add_row(self, info: object) -> None:
@@ -32,7 +110,17 @@ class WeightedPattern:
 
         :param info: an Entry instance, see data.py
         """
-        self.matrix[info] = generate_row(info.get_ratings(), self.length)
+        if self.view:
+            raise ValueError("Cannot add rows to a slice of a weighted pattern")
+        row = generate_row(info.get_ratings(), self.length)
+        if info not in self.index:
+            if self.dense and len(self.index) == len(self.array):
+                self.array = np.concatenate([self.array, np.empty(self.array.shape)])
+            self.index[info] = len(self.index)
+        if self.dense:
+            self.array[self.index[info]] = row
+        else:
+            self.matrix[info] = row
 
     # Get a specific weight via square bracket indexing, according to definition 1 of the paper
     # Or get a segment of the entire matrix using slice indexing, as used in definition 4 of the paper
@@ -47,7 +135,12 @@ class WeightedPattern:
         """
         if isinstance(item, slice):
             return self.slice(item)
-        return self.matrix[item[1]][item[0] - 1]
+        row = self.index[item[1]]
+        if self.height is not None and row >= self.height:
+            raise KeyError(item[1])
+        if self.dense:
+            return float(self.base.array[row, self.offset + item[0] - 1])
+        return self.matrix[item[1]][self.offset + item[0] - 1]
 
     # Return the length of the weighted pattern (positions, not objects)
     def __len__(self) -> int:
@@ -68,6 +161,10 @@ class WeightedPattern:
         :param pattern: a list of data entries
         :return: the score of the pattern
         """
+        if self.dense:
+            rows = [self.row(p) for p in pattern[:self.length]]
+            return float(self.weights[rows, range(len(rows))].sum())
+
         result = 0
         for c, p in enumerate(pattern):
             if c >= self.length:
@@ -75,25 +172,186 @@ class WeightedPattern:
             result += self[c + 1, p]
         return result
 
+    # Return the scores of many patterns at once, using the dense backend
+    def score_many(self, patterns: List[List[object]]) -> List[float]:
+        """
+        Return the scores of a list of patterns, which must all have the same length.
+        The dense backend looks up every weight in a single array operation.
+
+        :param patterns: a list of patterns, each a list of data entries
+        :return: the score of each pattern
+        """
+        if not self.dense:
+            return [self.score(pattern) for pattern in patterns]
+
+        if len(patterns) == 0:
+            return []
+        rows = np.array([[self.row(p) for p in pattern[:self.length]] for pattern in patterns], dtype=np.intp)
+        return self.weights[rows, np.arange(rows.shape[1])].sum(axis=1).tolist()
+
     # Return a segment of the weighted pattern as a new weighted pattern, using vertical slices
     def slice(self, segment: slice) -> object:
         """
         Return a horizontal slice of the weighted pattern given a slice object.
         The slice indicates the positional indices to use.
+        Nothing is copied, the slice is a view on the rows of this weighted pattern,
+        so slices of slices stay just as cheap. Rows cannot be added to a slice.
+        The slice keeps the data entries this weighted pattern had when it was taken,
+        rows added to this weighted pattern afterwards are not part of it.
+        With both backends, a row replaced in this weighted pattern afterwards is replaced in the slice too.
 
         :param segment: a slice object with a start and a stop
         :return: a new weighted pattern
         """
         start, stop = segment.start, segment.stop
-        result = WeightedPattern(stop - (start - 1))
-        result.matrix = {obj: scores[start - 1:stop] for obj, scores in self.matrix.items()}
-        return copy(result)
+        result = copy(self)
+        result.height = self.size()
+        result.offset = self.offset + start - 1
+        result.length = stop - (start - 1)
+        result.view = True
+        return result
+
+    # Return the weights of every data entry at a given position, a single column of the matrix
+    def column(self, pos: int) -> List[float]:
+        """
+        Return the weights of every data entry at a given positional index.
+
+        :param pos: the positional index [1...length]
+        :return: a list of weights, one for each data entry
+        """
+        if self.dense:
+            return self.weights[:, pos - 1]
+        return [self.matrix[info][self.offset + pos - 1] for info in islice(self.index, self.size())]
+
+    # Return the p-value of the weighted pattern, using dynamic programming over the score distribution
+    def pvalue(self, threshold: float, granularity: float = GRANULARITY, workers: int = None) -> float:
+        """
+        Return the p-value of a weighted pattern, which is the chance that the score passes the given threshold.
+        Instead of branching on every data entry at every position like Definition 4 of citation 1,
+        the distribution of partial scores is built up one position at a time.
+        Weights are rounded to multiples of the granularity, so the result is the exact p-value
+        of a threshold at most len(self) * granularity / 2 away from the given threshold.
+        Optional: splits the work over a pool of worker processes, see parallel_pvalue().
+
+        :param threshold: the threshold to surpass
+        :param granularity: the distance between two neighbouring scores in the distribution
+        :param workers: the amount of worker processes to use, or None to stay in this process.
+                        The dict backend uses at most two, see parallel_pvalue()
+        :return: the chance that the score surpasses the threshold [0...1]
+        """
+        if len(self) == 0:
+            return 1 if threshold <= 0 else 0
+        if workers is not None and workers > 1 and len(self) > 1:
+            return parallel_pvalue(self, threshold, granularity, workers)
+
+        columns = self.lattice_columns(granularity)
+        if self.dense:
+            return lattice_pvalue_array(columns, lattice_threshold(threshold, granularity), self.size())
+        return lattice_pvalue(columns, lattice_threshold(threshold, granularity), self.size())
+
+    # Return the distribution of all scores, to answer p-values for many thresholds
+    def score_distribution(self, granularity: float = GRANULARITY) -> object:
+        """
+        Return the distribution of the scores of all patterns, with every data entry equally likely at every position.
+        The weights are rounded the same way as in pvalue(), and the distribution
+        gives the same p-values as pvalue() for any threshold.
+
+        :param granularity: the distance between two neighbouring scores in the distribution
+        :return: a ScoreDistribution
+        """
+        if len(self) == 0:
+            return ScoreDistribution([0], [1.0], granularity)
+
+        columns = self.lattice_columns(granularity)
+        if self.dense:
+            low, chances = lattice_distribution_array(columns, self.size())
+            points = np.nonzero(chances)[0]
+            return ScoreDistribution((points + low).tolist(), chances[points].tolist(), granularity)
+
+        states = lattice_distribution(columns, self.size())
+        points = sorted(states)
+        return ScoreDistribution(points, [states[p] for p in points], granularity)
+
+    # Return the columns of the weighted pattern with the weights rounded to the lattice
+    def lattice_columns(self, granularity: float) -> List[object]:
+        """
+        Return every column of the weighted pattern with its weights rounded to multiples of the granularity.
+        The dict backend gives the columns of lattice_column(),
+        the dense backend gives the lowest lattice point and an array of counts from there on for each column.
+
+        :param granularity: the distance between two neighbouring lattice points
+        :return: a list of lattice columns
+        """
+        if self.dense:
+            points = np.rint(self.weights / granularity).astype(np.int64)
+            return [(int(column.min()), np.bincount(column - column.min())) for column in points.T]
+        return [lattice_column(self.column(i), granularity) for i in range(1, len(self) + 1)]
+
+    # Estimate the p-value of the weighted pattern by scoring random patterns
+    def pvalue_estimate(self, threshold: float, rel_error: float = 0.05, confidence: float = 0.95,
+                        batch: int = 10000, max_samples: int = 10000000,
+                        seed: int = None) -> Tuple[float, Tuple[float, float]]:
+        """
+        Return an estimate of the p-value of a weighted pattern, by scoring random patterns in batches.
+        Sampling stops once the Wilson confidence interval is within the relative error of the estimate,
+        or when the maximum amount of samples is reached.
+
+        :param threshold: the threshold to surpass
+        :param rel_error: the largest allowed half-width of the interval, relative to the estimate
+        :param confidence: the chance that the interval contains the p-value [0...1]
+        :param batch: the amount of random patterns scored at once
+        :param max_samples: the amount of random patterns after which to stop regardless
+        :param seed: a seed for the random generator, for reproducible estimates
+        :return: the estimate and the lower and upper bound of its confidence interval
+        """
+        if len(self) == 0:
+            exact = 1 if threshold <= 0 else 0
+            return exact, (exact, exact)
+
+        if self.dense:
+            weights = self.weights
+            best, worst = float(weights.max(axis=0).sum()), float(weights.min(axis=0).sum())
+        else:
+            columns = [self.column(i) for i in range(1, len(self) + 1)]
+            best, worst = sum(max(column) for column in columns), sum(min(column) for column in columns)
+        # No pattern can reach a threshold above the best score, and every pattern reaches one at the worst score,
+        # sampling would never find a hit in the first case and never tighten the interval in the second
+        if threshold > best:
+            return 0, (0, 0)
+        if threshold <= worst:
+            return 1, (1, 1)
+
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        if self.dense:
+            generator = np.random.default_rng(seed)
+            positions = np.arange(self.length)
+        else:
+            generator = random.Random(seed)
+
+        hits, samples = 0, 0
+        while True:
+            size = min(batch, max_samples - samples)
+            if self.dense:
+                rows = generator.integers(0, len(weights), size=(size, self.length))
+                hits += int((weights[rows, positions].sum(axis=1) >= threshold).sum())
+            else:
+                scores = [0.0] * size
+                for column in columns:
+                    scores = [s + w for s, w in zip(scores, generator.choices(column, k=size))]
+                hits += sum(1 for s in scores if s >= threshold)
+            samples += size
+
+            estimate = hits / samples
+            low, high = wilson_interval(hits, samples, z)
+            if (hits > 0 and (high - low) / 2 <= rel_error * estimate) or samples >= max_samples:
+                return estimate, (low, high)
 
     # Return the p-value of the weighted pattern, according to definition 4
-    def pvalue(self, threshold: float) -> float:
+    def pvalue_recursive(self, threshold: float) -> float:
         """
         Return the p-value of a weighted pattern, which is the chance that the score passes the given threshold,
-        as described in Definition 4 of citation 1
+        as described in Definition 4 of citation 1.
+        Takes O(|sigma|^length) time, kept as the exact reference for pvalue()
 
         :param threshold: the threshold to surpass
         :return: the chance that the score surpasses the threshold [0...1]
@@ -102,10 +360,492 @@ class WeightedPattern:
         if len(self) == 0:
             return 1 if threshold <= 0 else 0
 
-        sigma = self.matrix.keys()
+        sigma = self.symbols()
         delta = len(sigma)
         i = len(self)
-        return sum([self[1:i-1].pvalue(threshold - self[i, c]) for c in sigma]) / delta
+        prefix = self[1:i-1]
+        return sum([prefix.pvalue_recursive(threshold - self[i, c]) for c in sigma]) / delta
+
+    # Return a lookup table of weights for every position
+    def position_weights(self) -> List[Dict[object, float]]:
+        """
+        Return a dict for every position that maps each data entry to its weight at that position.
+
+        :return: a list of dicts, one for each position
+        """
+        symbols = self.symbols()
+        return [dict(zip(symbols, self.column(i))) for i in range(1, len(self) + 1)]
+
+    # Find every window of a text that passes the threshold by scoring them all
+    def search_naive(self, text: List[object], threshold: float) -> List[Tuple[int, float]]:
+        """
+        Return every window of a text of data entries whose score passes the given threshold,
+        by scoring every window in full. Entries of the text without a row never match.
+
+        :param text: a list of data entries, for example a chronological filmography
+        :param threshold: the threshold to surpass
+        :return: a list of the start index in the text and the score of every matching window
+        """
+        weights = self.position_weights()
+        result = []
+        for i in range(len(text) - len(self) + 1):
+            score = 0
+            for j, table in enumerate(weights):
+                if text[i + j] not in table:
+                    break
+                score += table[text[i + j]]
+            else:
+                if score >= threshold:
+                    result.append((i, score))
+        return result
+
+    # Find every window of a text that passes the threshold, skipping most windows with a filter
+    def search(self, text: List[object], threshold: float, limit: int = FILTER_LIMIT) -> List[Tuple[int, float]]:
+        """
+        Return every window of a text of data entries whose score passes the given threshold,
+        using the filtering and lookahead scoring ideas of citation 1.
+        Positions are visited from the most selective one down, the ones where the best weight
+        stands out the most from the average weight.
+        First every combination of entries on the q most selective positions that can still pass the threshold
+        is enumerated, with q as large as possible while there are at most limit of them.
+        Windows without one of these combinations are skipped with a single lookup,
+        the others are scored until the score can no longer pass the threshold.
+        The dense backend instead scores all windows at once, one position at a time,
+        dropping every window that can no longer pass after each position.
+        Entries of the text without a row never match.
+
+        :param text: a list of data entries, for example a chronological filmography
+        :param threshold: the threshold to surpass
+        :param limit: the most prefixes to enumerate
+        :return: a list of the start index in the text and the score of every matching window
+        """
+        if len(self) == 0:
+            return [(i, 0) for i in range(len(text) + 1)] if threshold <= 0 else []
+
+        weights = self.position_weights()
+        order = sorted(range(len(self)), reverse=True, key=lambda j: max(weights[j].values(), default=0) -
+                       sum(weights[j].values()) / max(1, len(weights[j])))
+        weights = [weights[j] for j in order]
+        # The highest score that can be added after each position
+        best = [0] * (len(self) + 1)
+        for j in reversed(range(len(self))):
+            best[j] = best[j + 1] + max(weights[j].values(), default=0)
+
+        if self.dense:
+            # Entries without a row get the index of an extra row that can never pass
+            rows = np.array([min(self.index.get(entry, self.size()), self.size()) for entry in text], dtype=np.intp)
+            table = np.vstack([self.weights, np.full(len(self), -np.inf)])
+            starts = np.arange(max(0, len(text) - len(self) + 1))
+            scores = np.zeros(len(starts))
+            for j, pos in enumerate(order):
+                scores += table[rows[starts + pos], pos]
+                passing = scores + best[j + 1] >= threshold
+                starts, scores = starts[passing], scores[passing]
+            return list(zip(starts.tolist(), scores.tolist()))
+
+        q, prefixes = 1, passing_prefixes(weights[:1], threshold - best[1], limit)
+        while prefixes is not None and q < len(self):
+            longer = passing_prefixes(weights[:q + 1], threshold - best[q + 1], limit)
+            if longer is None:
+                break
+            q, prefixes = q + 1, longer
+        if prefixes is None:
+            prefixes = {(entry,) for entry in weights[0]}
+
+        result = []
+        for i in range(len(text) - len(self) + 1):
+            if tuple([text[i + j] for j in order[:q]]) not in prefixes:
+                continue
+            # Lookahead scoring: stop as soon as the best possible rest cannot lift the score over the threshold
+            score = 0
+            for j, table in enumerate(weights):
+                if text[i + order[j]] not in table:
+                    break
+                score += table[text[i + order[j]]]
+                if score + best[j + 1] < threshold:
+                    break
+            else:
+                result.append((i, score))
+        return result
+
+
+class ScoreDistribution:
+    """
+    The distribution of the scores of a weighted pattern, see WeightedPattern.score_distribution().
+    Answers p-values and quantiles for any threshold in O(log n), where n is the amount of distinct scores.
+    """
+    def __init__(self, points: List[int], chances: List[float], granularity: float) -> None:
+        """
+        Initialize a score distribution from the chance of every score
+
+        :param points: the scores as ascending lattice points
+        :param chances: the chance of each score
+        :param granularity: the distance between two neighbouring lattice points
+        """
+        self.points = points
+        self.granularity = granularity
+        # The chance of scoring at least / at most each score, summed from the far end for precision
+        self.tail = [0.0] * (len(chances) + 1)
+        for i in reversed(range(len(chances))):
+            self.tail[i] = self.tail[i + 1] + chances[i]
+        self.head = []
+        total = 0.0
+        for chance in chances:
+            total += chance
+            self.head.append(total)
+
+    # Return the amount of distinct scores
+    def __len__(self) -> int:
+        """
+        Return the amount of distinct scores in the distribution.
+        Used to handle len() on the distribution
+
+        :return: the amount of scores
+        """
+        return len(self.points)
+
+    def scores(self) -> List[float]:
+        """
+        Return every possible score in ascending order
+
+        :return: a list of scores
+        """
+        return [p * self.granularity for p in self.points]
+
+    def pvalue(self, threshold: float) -> float:
+        """
+        Return the chance that the score passes the given threshold, see WeightedPattern.pvalue()
+
+        :param threshold: the threshold to surpass
+        :return: the chance that the score surpasses the threshold [0...1]
+        """
+        return self.tail[bisect.bisect_left(self.points, lattice_threshold(threshold, self.granularity))]
+
+    def quantile(self, q: float) -> float:
+        """
+        Return the lowest score that at least a given fraction of all patterns score at most
+
+        :param q: the fraction of patterns [0...1]
+        :return: the score
+        """
+        i = min(bisect.bisect_left(self.head, q), len(self.points) - 1)
+        return self.points[i] * self.granularity
+
+    def survival(self, thresholds: List[float]) -> List[float]:
+        """
+        Return the p-value of each given threshold
+
+        :param thresholds: a list of thresholds
+        :return: the chance that the score surpasses each threshold
+        """
+        return [self.pvalue(threshold) for threshold in thresholds]
+
+
+def passing_prefixes(weights: List[Dict[object, float]], threshold: float, limit: int) -> Union[set, None]:
+    """
+    Return every sequence of data entries whose score over the given positions passes the threshold.
+    Enumeration stops when there are more than limit of them.
+
+    :param weights: the weight tables of the first positions, see WeightedPattern.position_weights()
+    :param threshold: the threshold the sequences must surpass
+    :param limit: the most sequences to return
+    :return: a set of tuples of data entries, or None when there are more than limit of them
+    """
+    # Every position sorted from the highest weight down, so enumeration can stop at the first failing entry
+    ranked = [sorted(table.items(), key=lambda item: item[1], reverse=True) for table in weights]
+    best = [0] * (len(weights) + 1)
+    for j in reversed(range(len(weights))):
+        best[j] = best[j + 1] + (ranked[j][0][1] if ranked[j] else 0)
+
+    result = set()
+    stack = [((), 0)]
+    while stack:
+        prefix, score = stack.pop()
+        if len(prefix) == len(weights):
+            result.add(prefix)
+            if len(result) > limit:
+                return None
+            continue
+        for entry, weight in ranked[len(prefix)]:
+            if score + weight + best[len(prefix) + 1] < threshold:
+                break
+            stack.append(((*prefix, entry), score + weight))
+    return result
+
+
+def wilson_interval(hits: int, samples: int, z: float) -> Tuple[float, float]:
+    """
+    Return the Wilson score interval of a chance estimated from random samples
+
+    :param hits: the amount of samples that passed
+    :param samples: the total amount of samples
+    :param z: the standard normal quantile of the confidence
+    :return: the lower and upper bound of the interval
+    """
+    estimate = hits / samples
+    denominator = 1 + z * z / samples
+    center = (estimate + z * z / (2 * samples)) / denominator
+    half = z * math.sqrt(estimate * (1 - estimate) / samples + z * z / (4 * samples * samples)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def lattice_column(weights: List[float], granularity: float) -> Dict[int, int]:
+    """
+    Return how many data entries share each weight of a column, with the weights rounded to the lattice.
+
+    :param weights: the weights of a single position
+    :param granularity: the distance between two neighbouring lattice points
+    :return: a dict mapping lattice points to the amount of data entries with that weight
+    """
+    result = {}
+    for weight in weights:
+        point = round(weight / granularity)
+        result[point] = result.get(point, 0) + 1
+    return result
+
+
+def lattice_threshold(threshold: float, granularity: float) -> int:
+    """
+    Return the lowest lattice point that passes the given threshold.
+    Thresholds that lie on a lattice point (up to floating point noise) are kept as they are.
+
+    :param threshold: the threshold to surpass
+    :param granularity: the distance between two neighbouring lattice points
+    :return: the threshold as a lattice point
+    """
+    point = threshold / granularity
+    if abs(point - round(point)) < 1e-6:
+        return round(point)
+    return math.ceil(point)
+
+
+def lattice_pvalue(columns: List[Dict[int, int]], threshold: int, delta: int) -> float:
+    """
+    Return the chance that the sum of one weight from each column passes the threshold,
+    when every data entry is equally likely at every position.
+    Partial scores that will pass whatever comes next are counted right away,
+    and partial scores that can no longer pass are dropped.
+
+    :param columns: the lattice columns of the weighted pattern, see lattice_column()
+    :param threshold: the threshold to surpass, as a lattice point
+    :param delta: the amount of data entries
+    :return: the chance that the score surpasses the threshold [0...1]
+    """
+    # The highest and lowest score that can still be added after each position
+    best, worst = [0] * (len(columns) + 1), [0] * (len(columns) + 1)
+    for i in reversed(range(len(columns))):
+        best[i] = best[i + 1] + max(columns[i])
+        worst[i] = worst[i + 1] + min(columns[i])
+
+    if worst[0] >= threshold:
+        return 1
+    if best[0] < threshold:
+        return 0
+
+    passed = 0.0
+    states = {0: 1.0}
+    for i, column in enumerate(columns):
+        step = {}
+        for score, chance in states.items():
+            for weight, count in column.items():
+                step[score + weight] = step.get(score + weight, 0) + chance * count
+        states = {}
+        for score, chance in step.items():
+            if score + worst[i + 1] >= threshold:
+                passed += chance / delta
+            elif score + best[i + 1] >= threshold:
+                states[score] = chance / delta
+    return passed
+
+
+def lattice_distribution(columns: List[Dict[int, int]], delta: int) -> Dict[int, float]:
+    """
+    Return the chance of every sum of one weight from each column,
+    when every data entry is equally likely at every position.
+
+    :param columns: the lattice columns of the weighted pattern, see lattice_column()
+    :param delta: the amount of data entries
+    :return: a dict mapping every reachable lattice point to its chance
+    """
+    states = {0: 1.0}
+    for column in columns:
+        step = {}
+        for score, chance in states.items():
+            for weight, count in column.items():
+                step[score + weight] = step.get(score + weight, 0) + chance * count / delta
+        states = step
+    return states
+
+
+def lattice_distribution_array(columns: List[Tuple[int, object]], delta: int) -> Tuple[int, object]:
+    """
+    Return the same chances as lattice_distribution(), using numpy convolutions instead of dicts.
+    Requires numpy.
+
+    :param columns: the lattice columns of a dense weighted pattern, see lattice_pvalue_array()
+    :param delta: the amount of data entries
+    :return: the lowest lattice point and an array with the chance of every lattice point from there on
+    """
+    low, states = 0, np.ones(1)
+    for lowest, counts in columns:
+        states = np.convolve(states, counts / delta)
+        low += lowest
+    return low, states
+
+
+def lattice_pvalue_array(columns: List[Tuple[int, object]], threshold: int, delta: int) -> float:
+    """
+    Return the same chance as lattice_pvalue(), using numpy convolutions instead of dicts.
+    Requires numpy.
+
+    :param columns: for each position the lowest lattice point and an array counting the data entries
+                    on every lattice point from there on
+    :param threshold: the threshold to surpass, as a lattice point
+    :param delta: the amount of data entries
+    :return: the chance that the score surpasses the threshold [0...1]
+    """
+    # The highest and lowest score that can still be added after each position
+    best, worst = [0] * (len(columns) + 1), [0] * (len(columns) + 1)
+    for i in reversed(range(len(columns))):
+        lowest, counts = columns[i]
+        best[i] = best[i + 1] + lowest + len(counts) - 1
+        worst[i] = worst[i + 1] + lowest
+
+    if worst[0] >= threshold:
+        return 1
+    if best[0] < threshold:
+        return 0
+
+    passed = 0.0
+    # states[j] is the chance of the partial score low + j
+    low, states = 0, np.ones(1)
+    for i, (lowest, counts) in enumerate(columns):
+        states = np.convolve(states, counts / delta)
+        low += lowest
+        certain = min(max(0, threshold - worst[i + 1] - low), len(states))
+        passed += states[certain:].sum()
+        states = states[:certain]
+        hopeless = min(max(0, threshold - best[i + 1] - low), len(states))
+        states = states[hopeless:]
+        low += hopeless
+    return float(passed)
+
+
+# The worker processes of parallel_pvalue() by their amount, started on first use and reused by later calls
+process_pools = {}
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Return the pool with the given amount of worker processes, starting it if there is none yet
+
+    :param workers: the amount of worker processes
+    :return: the pool
+    """
+    if workers not in process_pools:
+        process_pools[workers] = ProcessPoolExecutor(workers)
+    return process_pools[workers]
+
+
+def parallel_pvalue(pattern: WeightedPattern, threshold: float, granularity: float, workers: int) -> float:
+    """
+    Return the same p-value as WeightedPattern.pvalue(), using a pool of worker processes.
+    The positions are split into one chunk per worker, and every worker builds the score distribution of its chunk.
+    Pairs of distributions are then convolved by the workers until two are left,
+    which are combined using the tail sums of the second one.
+    The pool is kept for later calls, so only the weights are sent to the workers every time.
+    The dict backend uses at most two workers. The last two distributions are combined in linear time,
+    but every other chunk adds a convolution of dict distributions in pure Python, which takes quadratic time.
+
+    :param pattern: the weighted pattern
+    :param threshold: the threshold to surpass
+    :param granularity: the distance between two neighbouring scores in the distribution
+    :param workers: the amount of worker processes
+    :return: the chance that the score surpasses the threshold [0...1]
+    """
+    chunks = min(workers if pattern.dense else 2, len(pattern))
+    bounds = [round(len(pattern) * c / chunks) for c in range(chunks + 1)]
+    pool = process_pool(min(workers, chunks))
+    distributions = list(pool.map(chunk_distribution, [pattern_chunk(pattern, start, stop)
+                                                       for start, stop in zip(bounds[:-1], bounds[1:])],
+                                  [granularity] * chunks))
+    while len(distributions) > 2:
+        pairs = list(zip(distributions[0::2], distributions[1::2]))
+        merged = list(pool.map(merge_distributions, *zip(*pairs)))
+        distributions = merged + distributions[len(pairs) * 2:]
+
+    return combine_distributions(*distributions, lattice_threshold(threshold, granularity))
+
+
+def pattern_chunk(pattern: WeightedPattern, start: int, stop: int) -> WeightedPattern:
+    """
+    Return a copy of a chunk of positions of a weighted pattern that can be sent to a worker process.
+    Data entries can hold unpicklable images, so the copy has the weights under integer keys
+
+    :param pattern: the weighted pattern
+    :param start: the position before the chunk [0...length]
+    :param stop: the last position of the chunk [1...length]
+    :return: a weighted pattern with the weights of the chunk
+    """
+    chunk = WeightedPattern(stop - start, pattern.dense)
+    chunk.index = {i: i for i in range(pattern.size())}
+    if pattern.dense:
+        chunk.array = np.ascontiguousarray(pattern.weights[:, start:stop])
+    else:
+        chunk.matrix = {i: [pattern[pos, entry] for pos in range(start + 1, stop + 1)]
+                        for i, entry in enumerate(pattern.symbols())}
+    return chunk
+
+
+def chunk_distribution(chunk: WeightedPattern, granularity: float) -> Union[Dict[int, float], Tuple[int, object]]:
+    """
+    Return the score distribution of a chunk of positions of a weighted pattern, in a worker process
+
+    :param chunk: the chunk, see pattern_chunk()
+    :param granularity: the distance between two neighbouring lattice points
+    :return: a distribution, see lattice_distribution() and lattice_distribution_array()
+    """
+    columns = chunk.lattice_columns(granularity)
+    if chunk.dense:
+        return lattice_distribution_array(columns, chunk.size())
+    return lattice_distribution(columns, chunk.size())
+
+
+def merge_distributions(first: Union[Dict[int, float], Tuple[int, object]],
+                        second: Union[Dict[int, float], Tuple[int, object]]) -> Union[Dict[int, float], Tuple[int, object]]:
+    """
+    Return the distribution of the sum of two scores, given the distributions of both scores
+
+    :param first: the distribution of the first score
+    :param second: the distribution of the second score
+    :return: the distribution of the sum
+    """
+    if isinstance(first, dict):
+        return lattice_distribution([first, second], 1)
+    return first[0] + second[0], np.convolve(first[1], second[1])
+
+
+def combine_distributions(first: Union[Dict[int, float], Tuple[int, object]],
+                          second: Union[Dict[int, float], Tuple[int, object]], threshold: int) -> float:
+    """
+    Return the chance that the sum of two scores passes the threshold, given the distributions of both scores.
+    Takes time linear in the size of the distributions, as no convolution is needed.
+
+    :param first: the distribution of the first score
+    :param second: the distribution of the second score
+    :param threshold: the threshold to surpass, as a lattice point
+    :return: the chance that the sum surpasses the threshold [0...1]
+    """
+    if isinstance(first, dict):
+        second = ScoreDistribution(sorted(second), [second[p] for p in sorted(second)], 1)
+        return sum(chance * second.tail[bisect.bisect_left(second.points, threshold - score)]
+                   for score, chance in first.items())
+
+    (low, chances), (other, others) = first, second
+    # tail[j] is the chance that the second score is at least other + j
+    tail = np.append(np.cumsum(others[::-1])[::-1], 0.0)
+    needed = np.clip(threshold - low - other - np.arange(len(chances)), 0, len(others))
+    return float((chances * tail[needed]).sum())
 
 
 def generate_row(scores: Tuple[float, List[float]], length: int) -> List[float]:
@@ -0,0 +1,322 @@
+from typing import Tuple, List, Dict, Callable
+import random
+import time
+import threading
+import tempfile
+import os
+import data
+import offline
+from searchindex import SearchIndex
+from algorithm import WeightedPattern, NUMPY, GRANULARITY
+
+# This module contains benchmarks for the algorithms and data handling, run it with "python benchmark.py"
+
+
+class SyntheticPerson(data.Entry):
+    """
+    A data entry with made up ratings, so benchmarks need no IMDb lookups
+    """
+    def __init__(self, id_: str, rating: float, previous: List[float]) -> None:
+        self.id = id_
+        self.name = id_
+        self.rating = rating
+        self.previous = previous
+
+    def get_ratings(self) -> Tuple[float, List[float]]:
+        """
+        Return the made up ratings of this person
+
+        :return: a tuple with a rating and a list of other ratings
+        """
+        return self.rating, self.previous
+
+
+def synthetic_people(amount: int, seed: int = 0) -> List[SyntheticPerson]:
+    """
+    Return a list of people with random ratings
+
+    :param amount: the amount of people
+    :param seed: a seed for the random generator
+    :return: a list of synthetic people
+    """
+    generator = random.Random(seed)
+    return [SyntheticPerson(f"nm{i:07}", round(generator.uniform(1, 10), 1),
+                            [round(generator.uniform(1, 10), 1) for _ in range(generator.randint(0, 5))])
+            for i in range(amount)]
+
+
+def synthetic_pattern(entries: int, length: int, dense: bool = NUMPY) -> WeightedPattern:
+    """
+    Return a weighted pattern filled with synthetic people
+
+    :param entries: the amount of data entries
+    :param length: the length of the weighted pattern
+    :param dense: whether to use the numpy array backend
+    :return: a weighted pattern
+    """
+    wp = WeightedPattern(length, dense)
+    for person in synthetic_people(entries):
+        wp.add_row(person)
+    return wp
+
+
+def timed(func: Callable, *args, **kwargs) -> Tuple[object, float]:
+    """
+    Call a function and measure how long it takes
+
+    :param func: the function to call
+    :return: the result of the function and the time it took in seconds
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def pvalue_speedup(entries: int = 300, length: int = 50, workers: Tuple[int, ...] = (2, 4)) -> Dict[int, float]:
+    """
+    Print and return the speedup of parallel p-value calculations over a single process
+
+    :param entries: the amount of data entries in the weighted pattern
+    :param length: the length of the weighted pattern
+    :param workers: the amounts of worker processes to compare
+    :return: a dict mapping every amount of workers to its speedup
+    """
+    wp = synthetic_pattern(entries, length)
+    threshold = 7.0 * length
+    single, base = timed(wp.pvalue, threshold)
+    print(f"p-value {entries}x{length}: 1 process {base * 1000:.1f} ms, {os.cpu_count()} CPUs")
+    result = {}
+    for amount in workers:
+        # The first call starts the worker processes, later calls reuse them
+        _, first = timed(wp.pvalue, threshold, workers=amount)
+        parallel, duration = timed(wp.pvalue, threshold, workers=amount)
+        result[amount] = base / duration
+        print(f"p-value {entries}x{length}: {amount} processes {duration * 1000:.1f} ms "
+              f"(first call {first * 1000:.1f} ms), speedup {result[amount]:.2f}x, "
+              f"difference {abs(parallel - single):.1e}")
+    return result
+
+
+def pvalue_accuracy(entries: int = 5, length: int = 4, thresholds: int = 20) -> int:
+    """
+    Print and return how many p-values of pvalue() are off from the exact p-value of pvalue_recursive()
+    by more than rounding the weights allows, on a small pattern with each backend.
+    pvalue() gives the exact p-value of a threshold at most len(pattern) * GRANULARITY / 2 away,
+    so it has to lie between the exact p-values at the ends of that range
+
+    :param entries: the amount of data entries in the weighted pattern
+    :param length: the length of the weighted pattern
+    :param thresholds: the amount of thresholds to check, spread over the possible scores
+    :return: the amount of p-values outside the tolerance
+    """
+    tolerance = length * GRANULARITY / 2
+    failures = 0
+    for name, dense in [('dict', False), ('dense', True)][:1 + NUMPY]:
+        wp = synthetic_pattern(entries, length, dense)
+        low = sum(min(wp.column(i)) for i in range(1, length + 1))
+        high = sum(max(wp.column(i)) for i in range(1, length + 1))
+        worst, outside = 0.0, 0
+        for step in range(thresholds + 1):
+            threshold = low + (high - low) * step / thresholds
+            result = wp.pvalue(threshold)
+            upper, lower = wp.pvalue_recursive(threshold - tolerance), wp.pvalue_recursive(threshold + tolerance)
+            outside += not lower - 1e-9 <= result <= upper + 1e-9
+            worst = max(worst, abs(result - wp.pvalue_recursive(threshold)))
+        print(f"p-value accuracy {name} {entries}x{length}: {thresholds + 1} thresholds, "
+              f"{outside} outside the tolerance of {tolerance}, largest difference {worst:.2e}")
+        failures += outside
+    return failures
+
+
+def estimate_coverage(entries: int = 6, length: int = 5, runs: int = 60, confidence: float = 0.95
+                      ) -> Dict[str, float]:
+    """
+    Print and return how often the confidence interval of pvalue_estimate() contains the exact p-value
+    of pvalue_recursive(), on a small pattern with each backend
+
+    :param entries: the amount of data entries in the weighted pattern
+    :param length: the length of the weighted pattern
+    :param runs: the amount of seeded estimates to make with each backend
+    :param confidence: the confidence of the intervals
+    :return: a dict mapping the name of each backend to the fraction of intervals containing the exact p-value
+    """
+    result = {}
+    for name, dense in [('dict', False), ('dense', True)][:1 + NUMPY]:
+        wp = synthetic_pattern(entries, length, dense)
+        threshold = wp.score_distribution().quantile(0.8)
+        exact = wp.pvalue_recursive(threshold)
+        inside = 0
+        for seed in range(runs):
+            _, (low, high) = wp.pvalue_estimate(threshold, rel_error=0.05, confidence=confidence, seed=seed)
+            inside += low <= exact <= high
+        result[name] = inside / runs
+        best = sum(max(wp.column(i)) for i in range(1, length + 1))
+        _, unreachable = timed(wp.pvalue_estimate, best + 1)
+        print(f"estimate {name} {entries}x{length}: exact {exact:.4f}, {inside}/{runs} intervals contain it "
+              f"at {confidence:.0%} confidence, unreachable threshold {unreachable * 1000:.2f} ms")
+    return result
+
+
+def search_throughput(entries: int = 200, length: int = 10, text_length: int = 200000,
+                      pvalue: float = 0.001) -> Dict[str, float]:
+    """
+    Print and return how many windows per second the naive and the filtering pattern search handle
+    on a long random text of synthetic people
+
+    :param entries: the amount of data entries in the weighted pattern
+    :param length: the length of the weighted pattern
+    :param text_length: the amount of data entries in the text
+    :param pvalue: the p-value of the threshold, which is about the fraction of windows that match
+    :return: a dict mapping the name of each search to its windows per second
+    """
+    wp = synthetic_pattern(entries, length)
+    generator = random.Random(1)
+    text = [generator.choice(wp.symbols()) for _ in range(text_length)]
+    threshold = wp.score_distribution().quantile(1 - pvalue)
+    result = {}
+    for name, search in [('naive', wp.search_naive), ('filter', wp.search)]:
+        matches, duration = timed(search, text, threshold)
+        result[name] = (text_length - length + 1) / duration
+        print(f"search {name}: {len(matches)} matches, {result[name]:,.0f} windows/s")
+    print(f"search speedup: {result['filter'] / result['naive']:.1f}x")
+    return result
+
+
+def apply_cost(cast_sizes: Tuple[int, ...] = (10, 100)) -> Dict[int, Tuple[float, float]]:
+    """
+    Print and return the cost of saving the ratings of a cast after viewing a movie,
+    one person at a time and in bulk, on a fresh database in a temporary directory
+
+    :param cast_sizes: the sizes of the casts to compare
+    :return: a dict mapping every cast size to the seconds taken one at a time and in bulk
+    """
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database = data.RatingsDatabase(os.path.join(directory, "ratings.db"))
+        people = data.RatingsTable(database, "people", data.people.columns, os.path.join(directory, "people.csv"),
+                                   data.people.parse, data.people.encode, data.people.decode)
+        for size in cast_sizes:
+            updates = {p.id: ("null", [7.0]) for p in synthetic_people(size)}
+            _, single = timed(lambda: [people.save(id_, ratings) for id_, ratings in updates.items()])
+            _, bulk = timed(people.save_many, updates)
+            result[size] = (single, bulk)
+            print(f"apply {size} cast members: one at a time {single * 1000:.1f} ms, in bulk {bulk * 1000:.1f} ms")
+        database.connection.close()
+    return result
+
+
+def synthetic_dump(directory: str, titles: int, names: int, seed: int = 0) -> None:
+    """
+    Write small made up IMDb dumps in the format of the public IMDb dataset, so offline.py can be tried without them
+
+    :param directory: the folder to write the dumps to
+    :param titles: the amount of titles
+    :param names: the amount of people
+    :param seed: the seed of the random generator
+    """
+    generator = random.Random(seed)
+    words = ["the", "dark", "night", "return", "of", "star", "matrix", "love", "city", "last", "king", "river"]
+    kinds = list(offline.KINDS) + ["tvEpisode"]
+    with open(os.path.join(directory, "title.basics.tsv"), 'w', encoding='utf-8') as file:
+        file.write("tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\t"
+                   "runtimeMinutes\tgenres\n")
+        for t in range(1, titles + 1):
+            title = " ".join(generator.choice(words) for _ in range(generator.randint(1, 4))).capitalize()
+            year = generator.choice(["\\N", str(generator.randint(1920, 2024))])
+            file.write(f"tt{t:07d}\t{generator.choice(kinds)}\t{title}\t{title}\t0\t{year}\t\\N\t90\tDrama\n")
+    with open(os.path.join(directory, "title.ratings.tsv"), 'w', encoding='utf-8') as file:
+        file.write("tconst\taverageRating\tnumVotes\n")
+        for t in range(1, titles + 1, 2):
+            file.write(f"tt{t:07d}\t{generator.randint(10, 100) / 10}\t{generator.randint(5, 100000)}\n")
+    with open(os.path.join(directory, "title.principals.tsv"), 'w', encoding='utf-8') as file:
+        file.write("tconst\tordering\tnconst\tcategory\tjob\tcharacters\n")
+        for t in range(1, titles + 1):
+            for ordering, category in enumerate(["director"] + [generator.choice(["actor", "actress", "writer"])
+                                                                  for _ in range(generator.randint(0, 9))]):
+                file.write(f"tt{t:07d}\t{ordering + 1}\tnm{generator.randint(1, names):07d}\t{category}\t\\N\t\\N\n")
+    with open(os.path.join(directory, "name.basics.tsv"), 'w', encoding='utf-8') as file:
+        file.write("nconst\tprimaryName\tbirthYear\tdeathYear\tprimaryProfession\tknownForTitles\n")
+        first, last = ["Ann", "Bob", "Chloé", "Dev", "Eve", "Femi"], ["Ng", "Smith", "Müller", "Okafor", "Rossi"]
+        for n in range(1, names + 1):
+            birth = generator.choice(["\\N", str(generator.randint(1900, 2010))])
+            file.write(f"nm{n:07d}\t{generator.choice(first)} {generator.choice(last)}\t{birth}\t\\N\tactor\t\\N\n")
+
+
+def offline_lookups(titles: int = 20000, names: int = 10000, lookups: int = 2000) -> Dict[str, float]:
+    """
+    Print and return the time taken by building the offline indexes of a synthetic dump,
+    and the average time of looking up and searching movies and people in them
+
+    :param titles: the amount of titles in the dump
+    :param names: the amount of people in the dump
+    :param lookups: the amount of lookups to average over
+    :return: a dict mapping the name of each operation to the seconds it takes
+    """
+    generator = random.Random(2)
+    result = {}
+    with tempfile.TemporaryDirectory() as directory:
+        synthetic_dump(directory, titles, names)
+        meta, result['build'] = timed(offline.build, directory, os.path.join(directory, "index"))
+        print(f"offline build: {meta['titles']} titles, {meta['names']} people in {result['build']:.2f} s")
+        dataset = offline.Dataset(os.path.join(directory, "index"))
+        dataset.open()
+        movies = [str(t) for t in generator.choices(dataset.columns['title.ids'], k=lookups)]
+        people = [str(n) for n in generator.choices(dataset.columns['name.ids'], k=lookups)]
+        for name, func, args in [('get_movie', dataset.get_movie, movies), ('get_person', dataset.get_person, people),
+                                 ('search_movie', dataset.search_movie, ["the dark", "matrix", "ki"] * (lookups // 3)),
+                                 ('search_person', dataset.search_person, ["ann", "chloe mu", "d"] * (lookups // 3))]:
+            _, duration = timed(lambda: [func(arg) for arg in args])
+            result[name] = duration / len(args)
+            print(f"offline {name}: {result[name] * 1e6:.0f} us")
+        dataset.maps.clear()
+    return result
+
+
+def instant_search(names: int = 1000000, queries: Tuple[str, ...] = ("k", "ann ro", "maria lo", "chloe mulr", "xq")
+                   ) -> Dict[str, float]:
+    """
+    Print and return the time taken by local searches, as made while typing, in an index of made up names
+
+    :param names: the amount of names in the index
+    :param queries: the queries to time, including a typo and a query without matches
+    :return: a dict mapping every query to the seconds it takes
+    """
+    generator = random.Random(3)
+    first = ["Ann", "Bob", "Chloé", "Dev", "Eve", "Femi", "Joe", "Maria", "Keanu", "Tom"]
+    syllables = ["ka", "ro", "mi", "ne", "ta", "lo", "ve", "sa", "ri", "do", "an", "el", "ber", "son", "ski", "ler"]
+    index = SearchIndex()
+    strings = []
+    for i in range(names):
+        name = f"{generator.choice(first)} {''.join(generator.choices(syllables, k=generator.randint(2, 4))).title()}"
+        strings.append((i, name, name, generator.randint(0, 100000)))
+    _, duration = timed(index.add_many, strings)
+    print(f"instant search: indexed {names} names in {duration:.1f} s")
+    result = {}
+    for query in queries:
+        found, result[query] = timed(index.search, query, 10)
+        print(f"instant search {query!r}: {result[query] * 1000:.2f} ms, {len(found)} results")
+    # Searches made while another thread adds strings, as happens while the index is loaded, must not wait long.
+    # The added strings are kept here, so the thread doesn't free them all at once when it ends
+    added = [(names + i, name, name, weight) for i, (_, name, _, weight) in enumerate(strings)]
+    adding = threading.Thread(target=index.add_many, args=(added,))
+    adding.start()
+    durations = []
+    while adding.is_alive():
+        for query in queries:
+            durations.append(timed(index.search, query, 10)[1])
+    durations.sort()
+    print(f"instant search while adding {names} names: {len(durations)} searches, "
+          f"99th percentile {durations[len(durations) * 99 // 100] * 1000:.2f} ms, "
+          f"slowest {durations[-1] * 1000:.2f} ms")
+    result['while adding'] = durations[-1]
+    return result
+
+
+if __name__ == "__main__":
+    pvalue_speedup()
+    pvalue_accuracy()
+    estimate_coverage()
+    search_throughput()
+    apply_cost()
+    offline_lookups()
+    instant_search()
@@ -1,9 +1,402 @@
 from imdb import IMDb
-from typing import List, Dict, Tuple
-import csv, requests, io
+from typing import List, Dict, Tuple, Callable, Union, Iterator, Iterable
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+import csv, requests, urllib3, io, os, json, sqlite3, threading, hashlib, pickle, time
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 import pygame
+import imdb.Movie, imdb.Person
+import offline
+from searchindex import SearchIndex
 
-ia = IMDb()
+# Set IMDB_DATASET to a folder of indexes built by offline.py to answer every lookup locally instead of from IMDb
+ia = offline.Dataset(os.environ['IMDB_DATASET']) if os.environ.get('IMDB_DATASET') else IMDb()
+
+
+class SingleFlight:
+    """
+    Coalesces fetches by key, so concurrent requests for the same key share a single fetch instead of each making their own
+    """
+    def __init__(self) -> None:
+        """
+        Initialize without any fetches in flight
+        """
+        self.flights = {}
+        self.stats = {'fetches': 0, 'shared': 0}
+        self.lock = threading.Lock()
+
+    def do(self, key: str, fetch: Callable) -> object:
+        """
+        Return the result of fetching a key, joining the fetch already in flight for that key if there is one.
+        Every request sharing a fetch gets its result, or has its exception raised
+
+        :param key: the key of the fetch
+        :param fetch: the function that fetches the result
+        :return: the result of the fetch
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.stats['shared'] += 1
+                shared = True
+            else:
+                future = self.flights[key] = Future()
+                self.stats['fetches'] += 1
+                shared = False
+        if shared:
+            return future.result()
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self.land(key, future)
+
+    def submit(self, key: str, executor: ThreadPoolExecutor, fetch: Callable) -> Future:
+        """
+        Start fetching a key on an executor, or join the fetch already in flight for that key if there is one
+
+        :param key: the key of the fetch
+        :param executor: the executor to fetch on
+        :param fetch: the function that fetches the result
+        :return: the future of the result of the fetch
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.stats['shared'] += 1
+                return future
+            future = self.flights[key] = executor.submit(fetch)
+            self.stats['fetches'] += 1
+        future.add_done_callback(lambda f: self.land(key, f))
+        return future
+
+    def land(self, key: str, future: Future) -> None:
+        """
+        Forget a fetch that finished, so the next request for its key fetches again
+
+        :param key: the key of the fetch
+        :param future: the future of the fetch that finished
+        """
+        with self.lock:
+            if self.flights.get(key) is future:
+                del self.flights[key]
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """
+    Raised instead of making a request to a host that failed too often recently
+    """
+
+
+class HttpClient:
+    """
+    A shared pool of keep-alive connections for downloading from a few hosts.
+    Every request has a deadline for the whole download, and a host that keeps failing is not contacted at all
+    for a while (circuit breaker) so a degraded host fails fast instead of stalling every download.
+    The latency of every request is kept per host.
+    """
+    def __init__(self, connections: int = 4, connect_timeout: float = 3.05, deadline: float = 10,
+                 failures: int = 5, cooldown: float = 30) -> None:
+        """
+        Initialize the client, no connections are opened until the first request
+
+        :param connections: the most connections open to a single host at once, more requests wait for one
+        :param connect_timeout: the seconds to wait for a connection to a host
+        :param deadline: the seconds a whole request may take, including downloading the response
+        :param failures: the failures in a row after which a host is not contacted for the cooldown
+        :param cooldown: the seconds a failing host is not contacted, after which a single request is tried again
+        """
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.failures = failures
+        self.cooldown = cooldown
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=connections, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host(self, name: str) -> Dict:
+        """
+        Return the circuit breaker state and latency metrics of a host, creating them if needed.
+        Should be called while holding the lock
+
+        :param name: the name of the host
+        :return: a dict with the state and metrics of the host
+        """
+        if name not in self.hosts:
+            self.hosts[name] = {'failures': 0, 'opened': None, 'trial': False, 'requests': 0, 'errors': 0,
+                                'rejected': 0, 'latencies': deque(maxlen=200)}
+        return self.hosts[name]
+
+    def get(self, url: str) -> bytes:
+        """
+        Download the content of a url within the deadline
+
+        :param url: the url to download
+        :return: the content of the response
+        :raises CircuitOpen: if the host failed too often recently
+        :raises requests.exceptions.RequestException: if the request failed or missed the deadline
+        """
+        name = urlsplit(url).netloc
+        with self.lock:
+            host = self.host(name)
+            if host['opened'] is not None:
+                # After the cooldown a single trial request decides whether the host is back
+                if host['trial'] or time.monotonic() - host['opened'] < self.cooldown:
+                    host['rejected'] += 1
+                    raise CircuitOpen(f"{name} failed {host['failures']} times in a row")
+                host['trial'] = True
+            host['requests'] += 1
+
+        start = time.monotonic()
+        try:
+            content = self.download(url, start + self.deadline)
+        except requests.exceptions.RequestException as e:
+            with self.lock:
+                host['errors'] += 1
+                host['trial'] = False
+                # A missing image is an answer, only errors of the host itself count towards opening the circuit
+                if e.response is None or e.response.status_code >= 500:
+                    host['failures'] += 1
+                    if host['failures'] >= self.failures:
+                        host['opened'] = time.monotonic()
+            raise
+        with self.lock:
+            host['latencies'].append(time.monotonic() - start)
+            host['failures'] = 0
+            host['opened'] = None
+            host['trial'] = False
+        return content
+
+    def download(self, url: str, deadline: float) -> bytes:
+        """
+        Download the content of a url, giving up when the deadline passes
+
+        :param url: the url to download
+        :param deadline: the time.monotonic() by which the download must be done
+        :return: the content of the response
+        :raises requests.exceptions.RequestException: if the request failed or missed the deadline
+        """
+        remaining = deadline - time.monotonic()
+        with self.session.get(url, stream=True, timeout=(min(self.connect_timeout, remaining), remaining)) as response:
+            response.raise_for_status()
+            # The timeouts of requests only limit each wait on the socket, so the deadline is checked after every read.
+            # read1 returns whatever arrived instead of waiting for a full chunk, so a slow host can't hold it up
+            chunks = []
+            try:
+                while True:
+                    chunk = response.raw.read1(64 * 1024, decode_content=True)
+                    if not chunk:
+                        return b"".join(chunks)
+                    chunks.append(chunk)
+                    if time.monotonic() > deadline:
+                        raise requests.exceptions.Timeout(f"{url} took longer than {self.deadline} seconds")
+            except urllib3.exceptions.ReadTimeoutError as e:
+                raise requests.exceptions.Timeout(e)
+            except urllib3.exceptions.HTTPError as e:
+                raise requests.exceptions.ConnectionError(e)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """
+        Return the request counts and latency percentiles of the recent requests to each host
+
+        :return: a dict of metrics for each host
+        """
+        with self.lock:
+            metrics = {}
+            for name, host in self.hosts.items():
+                latencies = sorted(host['latencies'])
+                metrics[name] = {
+                    'requests': host['requests'],
+                    'errors': host['errors'],
+                    'rejected': host['rejected'],
+                    'open': host['opened'] is not None,
+                    'p50': latencies[len(latencies) // 2] if latencies else None,
+                    'p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+                    'max': latencies[-1] if latencies else None
+                }
+            return metrics
+
+
+# The connections downloading posters and headshots
+image_client = HttpClient()
+# The worker threads downloading posters and headshots
+image_pool = ThreadPoolExecutor(max_workers=4)
+# Images of the same url, for example of the same movie in search results and in the info screen, share a download
+image_flights = SingleFlight()
+
+
+class LazyImage:
+    """
+    An image that is only downloaded, on a worker thread, the first time it is asked for
+    """
+    def __init__(self, url: Union[str, None]) -> None:
+        """
+        Initialize the image without downloading it
+
+        :param url: the url of the image, or None if there is no image
+        """
+        self.url = url
+        self.future = None
+
+    def get(self) -> Union[pygame.Surface, None]:
+        """
+        Return the image, starting the download if this is the first time it is asked for.
+        Returns None while the image is still downloading, or if it could not be downloaded
+
+        :return: the image or None
+        """
+        if self.url is None:
+            return None
+        if self.future is None:
+            surface = image_cache.recall(self.url)
+            if surface is not None:
+                self.future = Future()
+                self.future.set_result(surface)
+            else:
+                self.future = image_flights.submit(self.url, image_pool, lambda: image_cache.get(self.url))
+        if not self.future.done():
+            return None
+        return self.future.result()
+
+
+class ImageCache:
+    """
+    A cache of downloaded images, keyed by their url.
+    The downloaded (compressed) bytes are kept on disk within a budget, evicting the least recently used images,
+    and the most recently used images are also kept in memory decoded.
+    """
+    def __init__(self, directory: str, budget: int = 100 * 1024 * 1024, memory: int = 64) -> None:
+        """
+        Initialize the image cache, the directory is only read when the cache is first used
+
+        :param directory: the directory to store the images in
+        :param budget: the most bytes to store on disk
+        :param memory: the most decoded images to keep in memory
+        """
+        self.directory = directory
+        self.budget = budget
+        self.memory = memory
+        self.surfaces = OrderedDict()
+        self.files = None
+        self.size = 0
+        self.stats = {'memory hits': 0, 'disk hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.RLock()
+
+    def index(self) -> OrderedDict:
+        """
+        Return the files on disk and their sizes, from least to most recently used
+
+        :return: an ordered dict mapping file names to sizes
+        """
+        with self.lock:
+            if self.files is None:
+                os.makedirs(self.directory, exist_ok=True)
+                entries = sorted(os.scandir(self.directory), key=lambda e: e.stat().st_mtime)
+                self.files = OrderedDict((e.name, e.stat().st_size) for e in entries if e.is_file())
+                self.size = sum(self.files.values())
+            return self.files
+
+    def recall(self, url: str) -> Union[pygame.Surface, None]:
+        """
+        Return the decoded image of a url if it is in memory, without touching the disk or network
+
+        :param url: the url of the image
+        :return: the image, or None if it is not in memory
+        """
+        with self.lock:
+            if url not in self.surfaces:
+                return None
+            self.surfaces.move_to_end(url)
+            self.stats['memory hits'] += 1
+            return self.surfaces[url]
+
+    def get(self, url: str) -> Union[pygame.Surface, None]:
+        """
+        Return the image of a url, from memory, from disk, or downloaded when it is not cached
+
+        :param url: the url of the image
+        :return: the image, or None if it could not be downloaded
+        """
+        surface = self.recall(url)
+        if surface is not None:
+            return surface
+
+        name = hashlib.sha1(url.encode()).hexdigest()
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            cached = name in self.index()
+            if cached:
+                self.files.move_to_end(name)
+        try:
+            if cached:
+                with open(path, 'rb') as file:
+                    content = file.read()
+                os.utime(path)
+            else:
+                content = image_client.get(url)
+                self.store(name, content)
+            with self.lock:
+                self.stats['disk hits' if cached else 'misses'] += 1
+            surface = pygame.image.load_extended(io.BytesIO(content), url)
+        except (OSError, requests.exceptions.RequestException, pygame.error):
+            return None
+
+        with self.lock:
+            self.surfaces[url] = surface
+            while len(self.surfaces) > self.memory:
+                self.surfaces.popitem(last=False)
+        return surface
+
+    def store(self, name: str, content: bytes) -> None:
+        """
+        Write the bytes of an image to disk, evicting the least recently used images when over budget
+
+        :param name: the file name of the image
+        :param content: the bytes of the image
+        """
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            self.index()
+            with open(path + ".part", 'wb') as file:
+                file.write(content)
+            os.replace(path + ".part", path)
+            self.size += len(content) - self.files.pop(name, 0)
+            self.files[name] = len(content)
+            while self.size > self.budget and len(self.files) > 1:
+                oldest, size = self.files.popitem(last=False)
+                self.size -= size
+                self.stats['evictions'] += 1
+                try:
+                    os.remove(os.path.join(self.directory, oldest))
+                except FileNotFoundError:
+                    pass
+
+
+image_cache = ImageCache("imagecache")
+
+
+def resize_url(url: Union[str, None]) -> Union[str, None]:
+    """
+    Return the url of an IMDb image cropped to 303x450 pixels
+
+    :param url: the url of a poster or headshot, or None
+    :return: the url of the cropped image
+    """
+    if url is not None and "_CR" in url:
+        url = url[:-22]
+        return url + "450_CR0,0,303,450_.jpg" if url[-1] == "Y" else url + "303_CR0,0,303,450_.jpg"
+    return url
 
 
 class Entry:
@@ -19,6 +412,55 @@ class Entry:
         """
         return hash(self.id)
 
+    def __eq__(self, other: object) -> bool:
+        """
+        Return whether this data entry is the same entry as the given one, based on the type and entry id
+        Used to match data entries that were retrieved separately
+
+        :param other: the object to compare with
+        :return: whether both are the same entry
+        """
+        return type(self) is type(other) and self.id == other.id
+
+
+class LazyEntries(Sequence):
+    """
+    A list of data entries that only builds each entry from its IMDbPy object when it is first accessed
+    """
+    def __init__(self, kind: type, items: List[object]) -> None:
+        """
+        Initialize the list without building any entries
+
+        :param kind: the data entry class to build, like Person
+        :param items: the IMDbPy objects to build the entries from
+        """
+        self.kind = kind
+        self.items = items
+        self.entries = [None] * len(items)
+
+    def __len__(self) -> int:
+        """
+        Return the amount of entries.
+        Used to handle len() on the list
+
+        :return: the amount of entries
+        """
+        return len(self.items)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Entry, List[Entry]]:
+        """
+        Return the entry at an index, building it if this is the first time it is accessed.
+        Optional: returns a list of entries when given a slice object.
+
+        :param index: the index/slice of the entries to return
+        :return: an entry or a list of entries
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if self.entries[index] is None:
+            self.entries[index] = self.kind(self.items[index])
+        return self.entries[index]
+
 
 class Movie(Entry):
     """
@@ -27,24 +469,22 @@ class Movie(Entry):
     def __init__(self, movie: object, scores=(0, 0)) -> None:
         self.id = movie.movieID
         self.title = movie.get('title')
-        cast = movie.get('cast')
-        self.cast = [Person(p) for p in cast] if cast is not None else []
-        directors = movie.get('directors')
-        self.directors = [Person(p) for p in directors] if directors is not None else []
+        self.cast = LazyEntries(Person, movie.get('cast') or [])
+        self.directors = LazyEntries(Person, movie.get('directors') or [])
         self.year = movie.get('year')
-        try:
-            url = movie.get('cover url')
-            if url is not None and "_CR" in url:
-                url = url[:-22]
-                self.url = url + "450_CR0,0,303,450_.jpg" if url[-1] == "Y" else url + "303_CR0,0,303,450_.jpg"
-            else:
-                self.url = url
-            r = requests.get(self.url)
-            self.poster = pygame.image.load_extended(io.BytesIO(r.content), self.url)
-        except requests.exceptions.RequestException:
-            self.poster = None
+        self.url = resize_url(movie.get('cover url'))
+        self.image = LazyImage(self.url)
         self.scores = scores
 
+    @property
+    def poster(self) -> Union[pygame.Surface, None]:
+        """
+        Return the poster of this movie, or None while it is still downloading or if there is none
+
+        :return: the poster image
+        """
+        return self.image.get()
+
     def basic_info(self) -> Dict:
         """
         Return basic info to display in tables
@@ -68,19 +508,19 @@ class Person(Entry):
         self.birthdate = person.get('birth date')
         birthinfo = person.get('birth info')
         self.birthplace = birthinfo['birth place'] if birthinfo is not None else ""
-        try:
-            url = person.get('headshot')
-            if "_CR" in url:
-                url = url[:-22]
-                self.url = url + "450_CR0,0,303,450_.jpg" if url[-1] == "Y" else url + "303_CR0,0,303,450_.jpg"
-            else:
-                self.url = url
-            r = requests.get(self.url)
-            self.headshot = pygame.image.load_extended(io.BytesIO(r.content), self.url)
-        except Exception:
-            self.headshot = None
+        self.url = resize_url(person.get('headshot'))
+        self.image = LazyImage(self.url)
         self.scores = scores
 
+    @property
+    def headshot(self) -> Union[pygame.Surface, None]:
+        """
+        Return the headshot of this person, or None while it is still downloading or if there is none
+
+        :return: the headshot image
+        """
+        return self.image.get()
+
     def basic_info(self):
         """
         Return basic info to display in tables
@@ -95,7 +535,7 @@ class Person(Entry):
 
     def get_ratings(self) -> Tuple[float, List[float]]:
         """
-        Return the ratings of this person saved in the csv files
+        Return the ratings of this person saved in the ratings database
 
         :return: a tuple with a rating and a list of other ratings
         """
@@ -111,6 +551,153 @@ class Person(Entry):
         return self.name
 
 
+class MetadataCache:
+    """
+    A cache of IMDb lookups, kept in memory and in an SQLite database on disk.
+    Lookups younger than the ttl are served from the cache. Older lookups are still served from the cache,
+    but fetched again in the background (stale-while-revalidate). Lookups older than max_age are fetched again
+    before they are returned.
+    """
+    def __init__(self, path: str, ttl: float = 24 * 3600, max_age: float = 30 * 24 * 3600) -> None:
+        """
+        Initialize the cache, the database is only opened when it is first needed
+
+        :param path: the path of the database file
+        :param ttl: the seconds a lookup is served without fetching it again
+        :param max_age: the seconds after which a lookup must be fetched again before it is served
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.connection = None
+        self.memory = {}
+        self.refreshing = set()
+        self.flights = SingleFlight()
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.lock = threading.RLock()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Return the connection to the database, opening it if needed
+
+        :return: the connection
+        """
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(self.path, check_same_thread=False)
+                self.connection.execute("CREATE TABLE IF NOT EXISTS lookups "
+                                        "(key TEXT PRIMARY KEY, stored REAL, value BLOB)")
+            return self.connection
+
+    def lookup(self, key: str) -> Union[Tuple[float, object], None]:
+        """
+        Return when a lookup was stored and its value, from memory or from disk
+
+        :param key: the key of the lookup
+        :return: the time it was stored and the value, or None if it is not cached
+        """
+        with self.lock:
+            if key not in self.memory:
+                row = self.connect().execute("SELECT stored, value FROM lookups WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                self.memory[key] = (row[0], pickle.loads(row[1]))
+            return self.memory[key]
+
+    def store(self, key: str, value: object) -> None:
+        """
+        Store the value of a lookup in memory and on disk
+
+        :param key: the key of the lookup
+        :param value: the value of the lookup
+        """
+        stored = time.time()
+        with self.lock:
+            self.memory[key] = (stored, value)
+            with self.connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO lookups VALUES (?, ?, ?)",
+                                   (key, stored, pickle.dumps(value)))
+
+    def get(self, key: str, fetch: Callable) -> object:
+        """
+        Return the value of a lookup, from the cache if it is recent enough or else by fetching it
+
+        :param key: the key of the lookup
+        :param fetch: the function that fetches the value from IMDb
+        :return: the value of the lookup
+        """
+        found = self.lookup(key)
+        if found is not None:
+            age = time.time() - found[0]
+            if age < self.ttl:
+                return found[1]
+            if age < self.max_age:
+                self.revalidate(key, fetch)
+                return found[1]
+        return self.load(key, fetch)
+
+    def load(self, key: str, fetch: Callable) -> object:
+        """
+        Fetch a lookup and store it, sharing the fetch with every other load of the same key in flight.
+        A lookup stored by a load that finished in the meantime is returned without fetching again
+
+        :param key: the key of the lookup
+        :param fetch: the function that fetches the value from IMDb
+        :return: the value of the lookup
+        """
+        def flight() -> object:
+            found = self.lookup(key)
+            if found is not None and time.time() - found[0] < self.ttl:
+                return found[1]
+            value = fetch()
+            self.store(key, value)
+            return value
+
+        return self.flights.do(key, flight)
+
+    def scan(self, prefix: str) -> Iterator[object]:
+        """
+        Yield the values of every lookup on disk with a key starting with a prefix, without keeping them in memory
+
+        :param prefix: the start of the keys, like "movie:"
+        :return: an iterator of values
+        """
+        with self.lock:
+            rows = self.connect().execute("SELECT value FROM lookups WHERE substr(key, 1, ?) = ?",
+                                          (len(prefix), prefix)).fetchall()
+        for row in rows:
+            try:
+                yield pickle.loads(row[0])
+            except Exception:
+                pass
+
+    def revalidate(self, key: str, fetch: Callable) -> None:
+        """
+        Fetch a lookup again in the background, keeping the cached value if that fails
+
+        :param key: the key of the lookup
+        :param fetch: the function that fetches the value from IMDb
+        """
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self.load(key, fetch)
+            except Exception:
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        self.pool.submit(refresh)
+
+
+metadata_cache = MetadataCache("imdbcache.db")
+
+
 def get_movie(id_: str) -> Movie:
     """
     Return a movie retrieved from IMDbPy by a given movie id
@@ -118,7 +705,7 @@ def get_movie(id_: str) -> Movie:
     :param id_: the IMDb id of a movie
     :return: a movie data entry
     """
-    return Movie(ia.get_movie(id_, info=['main']))
+    return update_movie(id_, ['main'])
 
 
 def get_person(id_: str) -> Person:
@@ -128,7 +715,21 @@ def get_person(id_: str) -> Person:
     :param id_: the IMDb id of a person
     :return: a person data entry
     """
-    return Person(ia.get_person(id_, info=['main']))
+    return update_person(id_, ['main'])
+
+
+def lookup(key: str, fetch: Callable) -> object:
+    """
+    Return the value of an IMDb lookup from the metadata cache.
+    The local dataset answers faster than the cache, so its lookups are not cached
+
+    :param key: the key of the lookup
+    :param fetch: the function that fetches the value from IMDb
+    :return: the value of the lookup
+    """
+    if isinstance(ia, offline.Dataset):
+        return fetch()
+    return metadata_cache.get(key, fetch)
 
 
 def search_movie(query: str, amount: int) -> List[Movie]:
@@ -139,7 +740,21 @@ def search_movie(query: str, amount: int) -> List[Movie]:
     :param amount: amount of results to return
     :return: list of movie search results
     """
-    return [Movie(m) for m in list(ia.search_movie(query))[0:amount]]
+    return list(iter_search_movie(query, amount))
+
+
+def iter_search_movie(query: str, amount: int) -> Iterator[Movie]:
+    """
+    Yield a number of search results based on a given query, building each result when it is asked for
+
+    :param query: the movie title to search for
+    :param amount: amount of results to return
+    :return: an iterator of movie search results
+    """
+    results = lookup(f"search movie:{query.strip().lower()}", lambda: list(ia.search_movie(query)))
+    remember_movies(results)
+    for m in results[0:amount]:
+        yield Movie(m)
 
 
 def search_person(query: str, amount: int) -> List[object]:
@@ -150,7 +765,32 @@ def search_person(query: str, amount: int) -> List[object]:
     :param amount: amount of results to return
     :return: list of people search results
     """
-    return [Person(p) for p in list(ia.search_person(query))[0:amount]]
+    return list(iter_search_person(query, amount))
+
+
+def iter_search_person(query: str, amount: int) -> Iterator[Person]:
+    """
+    Yield a number of search results based on a given query, building each result when it is asked for
+
+    :param query: the name of the person to search for
+    :param amount: amount of results to return
+    :return: an iterator of people search results
+    """
+    results = lookup(f"search person:{query.strip().lower()}", lambda: list(ia.search_person(query)))
+    remember_people(results)
+    for p in results[0:amount]:
+        yield Person(p)
+
+
+def info_sets(tags: List[str]) -> List[str]:
+    """
+    Return the sets of data to retrieve from IMDbPy in a single request, always including the main set
+    the data entries are built from. Also used in the cache keys, so the same sets always give the same key
+
+    :param tags: the extra sets of data to retrieve
+    :return: the sorted sets of data without duplicates
+    """
+    return sorted(set(tags) | {'main'})
 
 
 def update_movie(id_: str, tags: List[str]) -> Movie:
@@ -161,8 +801,10 @@ def update_movie(id_: str, tags: List[str]) -> Movie:
     :param tags: the sets of data to retrieve from IMDbPy
     :return: a movie data entry
     """
-    movie = ia.get_movie(id_)
-    ia.update(movie, info=tags)
+    info = info_sets(tags)
+    movie = lookup(f"movie:{id_}:{','.join(info)}", lambda: ia.get_movie(id_, info=info))
+    remember_movies([movie])
+    remember_people((movie.get('cast') or []) + (movie.get('directors') or []))
     return Movie(movie)
 
 
@@ -174,68 +816,333 @@ def update_person(id_: str, tags: List[str]) -> Person:
     :param tags: the sets of data to retrieve from IMDbPy
     :return: a person data entry
     """
-    person = ia.get_person(id_)
-    ia.update(person, info=tags)
+    info = info_sets(tags)
+    person = lookup(f"person:{id_}:{','.join(info)}", lambda: ia.get_person(id_, info=info))
+    remember_people([person])
     return Person(person)
 
 
+# Every title and name the app has seen, so they can be searched locally while they are being typed
+movie_index = SearchIndex()
+person_index = SearchIndex()
+index_loader = None
+
+
+def remember_movies(movies: Iterable[object]) -> None:
+    """
+    Add IMDbPy movies to the local search index
+
+    :param movies: the IMDbPy movies
+    """
+    movie_index.add_many((m.movieID, m.get('title'), (m.movieID, m.get('title'), m.get('year')), m.get('votes') or 0)
+                         for m in movies if m.movieID is not None)
+
+
+def remember_people(people: Iterable[object]) -> None:
+    """
+    Add IMDbPy people to the local search index
+
+    :param people: the IMDbPy people
+    """
+    person_index.add_many((p.personID, p.get('name'), (p.personID, p.get('name'), p.get('birth date')), 0)
+                          for p in people if p.personID is not None)
+
+
+def load_search_index() -> None:
+    """
+    Fill the local search index with everything in the metadata cache.
+    Runs on a worker thread the first time it is called, searches meanwhile find what was added so far.
+    The local dataset is not copied into the index, it is searched from its memory-mapped indexes instead
+    """
+    global index_loader
+    if index_loader is not None:
+        return
+
+    def load() -> None:
+        for results in metadata_cache.scan("search movie:"):
+            remember_movies(results)
+        for results in metadata_cache.scan("search person:"):
+            remember_people(results)
+        for movie in metadata_cache.scan("movie:"):
+            remember_movies([movie])
+            remember_people((movie.get('cast') or []) + (movie.get('directors') or []))
+        for person in metadata_cache.scan("person:"):
+            remember_people([person])
+
+    index_loader = threading.Thread(target=load, daemon=True)
+    index_loader.start()
+
+
+def instant_results(dataset: List[Tuple], seen: List[Tuple], amount: int) -> List[Tuple]:
+    """
+    Return the results of the local dataset followed by the results of the search index it doesn't have,
+    which adds matches on later words and fuzzy matches of the titles and names the app has seen
+
+    :param dataset: the id, title or name, and year or birth date of every result of the local dataset
+    :param seen: the same for every result of the search index
+    :param amount: the most results to return
+    :return: the combined results without duplicates
+    """
+    ids = {result[0] for result in dataset}
+    return (dataset + [result for result in seen if result[0] not in ids])[:amount]
+
+
+def instant_search_movie(query: str, amount: int) -> List[Movie]:
+    """
+    Return a number of movies the app has seen best matching a query, without going to IMDb.
+    Fast enough to call on every key press. In offline mode every title in the local dataset is searched as well
+
+    :param query: the movie title being typed
+    :param amount: amount of results to return
+    :return: list of movie search results
+    """
+    load_search_index()
+    results = movie_index.search(query, amount)
+    if isinstance(ia, offline.Dataset):
+        results = instant_results([(m.movieID, m.get('title'), m.get('year')) for m in ia.search_movie(query, amount)],
+                                  results, amount)
+    return [Movie(imdb.Movie.Movie(movieID=id_, data={'title': title, 'year': year}))
+            for id_, title, year in results]
+
+
+def instant_search_person(query: str, amount: int) -> List[Person]:
+    """
+    Return a number of people the app has seen best matching a query, without going to IMDb.
+    Fast enough to call on every key press. In offline mode every person in the local dataset is searched as well
+
+    :param query: the name of the person being typed
+    :param amount: amount of results to return
+    :return: list of people search results
+    """
+    load_search_index()
+    results = person_index.search(query, amount)
+    if isinstance(ia, offline.Dataset):
+        results = instant_results([(p.personID, p.get('name'), p.get('birth date'))
+                                   for p in ia.search_person(query, amount)], results, amount)
+    return [Person(imdb.Person.Person(personID=id_, data={'name': name, 'birth date': birthdate}))
+            for id_, name, birthdate in results]
+
+
+class RatingsDatabase:
+    """
+    The SQLite database holding all ratings.
+    Ratings of people and movies from the csv files of older versions are migrated into it once, when it is created.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the database, the connection is only opened when it is first needed
+
+        :param path: the path of the database file
+        """
+        self.path = path
+        self.connection = None
+        self.tables = []
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Return the connection to the database, opening it and migrating the csv files if needed
+
+        :return: the connection
+        """
+        with self.lock:
+            if self.connection is None:
+                # Transactions are started explicitly, see transaction()
+                self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                # Write-ahead logging keeps the database intact if the app crashes halfway through a commit
+                self.connection.execute("PRAGMA journal_mode = WAL")
+                self.connection.execute("PRAGMA synchronous = FULL")
+                if self.connection.execute("PRAGMA user_version").fetchone()[0] == 0:
+                    self.migrate()
+            return self.connection
+
+    @contextmanager
+    def transaction(self) -> sqlite3.Connection:
+        """
+        Return a context in which all writes are committed together when it exits, or not at all if it fails.
+        Nested transactions join the outermost one
+
+        :return: the connection
+        """
+        with self.lock:
+            connection = self.connect()
+            if self.depth == 0:
+                connection.execute("BEGIN IMMEDIATE")
+            self.depth += 1
+            try:
+                yield connection
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    connection.execute("ROLLBACK")
+                    # The rows in memory may hold writes that were just rolled back
+                    for table in self.tables:
+                        table.rows = None
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                connection.execute("COMMIT")
+
+    def migrate(self) -> None:
+        """
+        Create the tables, and copy the ratings from the csv files of older versions if they exist.
+        The csv files themselves are left untouched.
+        """
+        with self.transaction() as connection:
+            for table in self.tables:
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table.name} "
+                                   f"(id TEXT PRIMARY KEY, {', '.join(f'{c} TEXT' for c in table.columns)})")
+                try:
+                    with open(table.csvpath, 'r', newline='') as csvfile:
+                        for k, *v in csv.reader(csvfile):
+                            table.write(connection, k, table.parse(*v))
+                except FileNotFoundError:
+                    pass
+            connection.execute("PRAGMA user_version = 1")
+
+
+class RatingsTable:
+    """
+    A table of ratings in the ratings database, kept in memory for the whole process.
+    The table is only read again when another connection changed the database.
+    """
+    def __init__(self, database: RatingsDatabase, name: str, columns: List[str], csvpath: str,
+                 parse: Callable, encode: Callable, decode: Callable) -> None:
+        """
+        Initialize the ratings table
+
+        :param database: the database holding the table
+        :param name: the name of the table
+        :param columns: the names of the columns after the id
+        :param csvpath: the csv file of older versions to migrate the ratings from
+        :param parse: turns the fields of a csv row after the id into ratings
+        :param encode: turns ratings into the values of the columns
+        :param decode: turns the values of the columns back into ratings
+        """
+        self.database = database
+        self.name = name
+        self.columns = columns
+        self.csvpath = csvpath
+        self.parse = parse
+        self.encode = encode
+        self.decode = decode
+        self.rows = None
+        self.version = None
+        database.tables.append(self)
+
+    def load(self) -> Dict:
+        """
+        Return the ratings for each id, reading the table only if another connection changed the database.
+        The dict is shared by every caller, so it should not be modified outside of save()
+
+        :return: a dict of ratings for each id
+        """
+        with self.database.lock:
+            connection = self.database.connect()
+            version = connection.execute("PRAGMA data_version").fetchone()[0]
+            if self.rows is None or version != self.version:
+                query = f"SELECT id, {', '.join(self.columns)} FROM {self.name}"
+                self.rows = {k: self.decode(*v) for k, *v in connection.execute(query)}
+                self.version = version
+            return self.rows
+
+    def write(self, connection: sqlite3.Connection, id_: str, ratings: Tuple) -> None:
+        """
+        Insert or replace the row of a single id
+
+        :param connection: the connection to write with
+        :param id_: the id to save the ratings of
+        :param ratings: the ratings of the id
+        """
+        connection.execute(f"INSERT OR REPLACE INTO {self.name} VALUES ({', '.join('?' * (len(self.columns) + 1))})",
+                           (id_, *self.encode(*ratings)))
+
+    def save(self, id_: str, ratings: Tuple) -> None:
+        """
+        Save the ratings of an id, updating the rows in memory and the row in the table
+
+        :param id_: the id to save the ratings of
+        :param ratings: the ratings of the id
+        """
+        with self.database.transaction() as connection:
+            rows = self.load()
+            self.write(connection, id_, ratings)
+            # Store the ratings the way they read back from the table
+            rows[id_] = self.decode(*self.encode(*ratings))
+
+    def save_many(self, ratings: Dict[str, Tuple]) -> None:
+        """
+        Save the ratings of many ids in a single statement and a single commit
+
+        :param ratings: a dict of ratings for each id
+        """
+        with self.database.transaction() as connection:
+            rows = self.load()
+            encoded = {id_: self.encode(*r) for id_, r in ratings.items()}
+            connection.executemany(f"INSERT OR REPLACE INTO {self.name} "
+                                   f"VALUES ({', '.join('?' * (len(self.columns) + 1))})",
+                                   [(id_, *e) for id_, e in encoded.items()])
+            rows.update({id_: self.decode(*e) for id_, e in encoded.items()})
+
+
+database = RatingsDatabase("ratings.db")
+people = RatingsTable(database, "people", ["rating", "results"], "people.csv",
+                      lambda r, *t: (r, list(t)),
+                      lambda r, t: (str(r), json.dumps([str(f) for f in t])),
+                      lambda r, t: (r, json.loads(t)))
+movies = RatingsTable(database, "movies", ["prediction", "rating"], "movies.csv",
+                      lambda p, r: (p, r),
+                      lambda p, r: (str(p), str(r)),
+                      lambda p, r: (p, r))
+
+
 def save_person_rating(id_: str, rating: float, results: List[float]) -> None:
     """
-    Save the ratings of a person to the csv files
+    Save the ratings of a person to the ratings database
 
     :param id_: the id of the person
     :param rating: the rating of the person
     :param results: the ratings of their movies
     """
-    rows = load_person_ratings()
-    rows[id_] = (rating, results)
-    with open('people.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        for row in rows:
-            writer.writerow([row, rows[row][0], *rows[row][1]])
+    people.save(id_, (rating, results))
+
+
+def save_person_ratings_bulk(ratings: Dict[str, Tuple[float, List[float]]]) -> None:
+    """
+    Save the ratings of many people to the ratings database at once
+
+    :param ratings: a dict of the rating of the person and the ratings of their movies for each person id
+    """
+    people.save_many(ratings)
 
 
 def load_person_ratings() -> Dict:
     """
-    Load the ratings of a person from the csv files
+    Load the ratings of a person from the ratings database.
+    The table is only read again when it changed, see RatingsTable
 
     :return: a dict of ratings for each person id
     """
-    try:
-        with open("people.csv", 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            return {k: (r, t) for k, r, *t in reader}
-    except FileNotFoundError:
-        _ = open("people.csv", 'x', newline='')
-        return {}
+    return people.load()
 
 
 def save_movie_rating(id_: str, prediction: float, rating: float) -> None:
     """
-    Save the ratings of a movie to the csv files
+    Save the ratings of a movie to the ratings database
 
     :param id_: the id of the movie
     :param prediction: the predicted score of the movie
     :param rating: the rating of the movie
     """
-    rows = load_movie_ratings()
-    rows[id_] = (prediction, rating)
-    with open('movies.csv', 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        for row in rows:
-            writer.writerow([row, rows[row][0], rows[row][1]])
+    movies.save(id_, (prediction, rating))
 
 
 def load_movie_ratings() -> Dict:
     """
-    Load the ratings of a movie from the csv files
+    Load the ratings of a movie from the ratings database.
+    The table is only read again when it changed, see RatingsTable
 
     :return: a dict of ratings for each movie id
     """
-    try:
-        with open("movies.csv", 'r', newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            return {k: (r, p) for k, r, p in reader}
-    except FileNotFoundError:
-        _ = open("movies.csv", 'x', newline='')
-        return {}
+    return movies.load()
@@ -4,10 +4,18 @@ import sys
 import os
 
 import scenes
+import uielements
 
 
 os.environ['SDL_VIDEO_WINDOW_POS'] = '%d,%d' % (0, 20)
 
+# The frames per second while something is happening, and while the app is sitting idle
+FPS_ACTIVE = 60
+FPS_IDLE = 10
+
+# The milliseconds without input or anything changing on screen after which the app counts as idle
+IDLE_DELAY = 1000
+
 
 if __name__ == "__main__":
     # Initialize pygame and its settings
@@ -20,19 +28,48 @@ if __name__ == "__main__":
     # The director controlling the scenes
     director = scenes.Director()
 
+    # Run with --stats to show how many text renders per frame the text cache saves in the window title
+    showstats = "--stats" in sys.argv
+    shown = 0
+
+    # When something last happened
+    active = pygame.time.get_ticks()
+
     # The main loop
     while True:
-        FPS.tick(60)
+        if pygame.time.get_ticks() - active > IDLE_DELAY:
+            # Sleep until there is input, but still update a few times a second for background work finishing
+            event = pygame.event.wait(1000 // FPS_IDLE)
+            events = [] if event.type == pygame.NOEVENT else [event]
+            FPS.tick()
+        else:
+            FPS.tick(FPS_ACTIVE)
+            events = []
+        events += pygame.event.get()
 
         # Handle exiting
-        if pygame.event.get(pygame.QUIT):
+        if any(event.type == pygame.QUIT for event in events):
             pygame.quit()
             sys.exit()
 
         # Call the necessary scene functions of the active scene
-        director.scene.handle_events(pygame.event.get())
+        director.scene.handle_events(events)
         director.scene.update()
-        director.scene.render(surface)
+        rects = director.scene.draw(surface)
+
+        # Draw the parts of the surface that changed to the screen, or all of it when the window has to be redrawn
+        if any(event.type == pygame.WINDOWEXPOSED for event in events):
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+
+        # Animations like hovering over a button are still going while their scene keeps changing
+        if events or rects:
+            active = pygame.time.get_ticks()
 
-        # Draw the surface to the screen
-        pygame.display.flip()
+        frame = uielements.text_cache.end_frame()
+        if showstats and pygame.time.get_ticks() - shown > 1000:
+            shown = pygame.time.get_ticks()
+            pygame.display.set_caption(f"Movie Enjoyment Predictor - text renders saved: {frame['hits']} of "
+                                       f"{frame['hits'] + frame['misses']} this frame, "
+                                       f"{uielements.text_cache.size // 1024} KiB cached")
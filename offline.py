@@ -0,0 +1,452 @@
+from typing import List, Dict, Tuple, Iterator, Union
+from collections import Counter
+from collections.abc import Sequence
+from array import array
+from imdb import IMDbDataAccessError
+from imdb.Movie import Movie
+from imdb.Person import Person
+import bisect, csv, gzip, heapq, json, mmap, os, re, sys, threading, unicodedata
+
+# This module serves IMDb lookups from the public IMDb dataset dumps (https://datasets.imdbws.com/) instead of from IMDb.
+# Build the indexes once with "python offline.py <folder with the .tsv.gz dumps> <index folder>",
+# then set the IMDB_DATASET environment variable to the index folder, see data.py
+
+# The IMDbPy kind of each IMDb title type that is kept, episodes are left out since they are never searched for
+KINDS = {
+    'movie': 'movie',
+    'short': 'short',
+    'tvMovie': 'tv movie',
+    'tvSeries': 'tv series',
+    'tvMiniSeries': 'tv mini series',
+    'tvSpecial': 'tv special',
+    'tvShort': 'tv short',
+    'video': 'video movie',
+    'videoGame': 'video game'
+}
+
+# The principal categories that are kept, and whether they belong in the cast or in the directors of a title
+ROLES = {
+    'actor': 'cast',
+    'actress': 'cast',
+    'self': 'cast',
+    'director': 'directors'
+}
+
+# The most index entries looked at for a single search, so a very short query can't take long
+SCAN_LIMIT = 50000
+
+# Leading articles that titles can also be found without
+ARTICLES = ("the ", "a ", "an ")
+
+
+def normalize(text: str) -> str:
+    """
+    Return the form of a title or name used for searching: lowercase, without accents,
+    and with every run of other characters than letters and digits replaced by a single space
+
+    :param text: the title or name
+    :return: the normalized text
+    """
+    if text.isascii():
+        return re.sub("[^a-z0-9]+", " ", text.lower()).strip()
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return " ".join("".join(c if c.isalnum() else " " for c in text if not unicodedata.combining(c)).split())
+
+
+def search_keys(text: str) -> List[str]:
+    """
+    Return the keys a title or name can be found by, the normalized text and also the text without a leading article
+
+    :param text: the title or name
+    :return: a list of keys
+    """
+    key = normalize(text)
+    keys = [key]
+    for article in ARTICLES:
+        if key.startswith(article):
+            keys.append(key[len(article):])
+    return keys
+
+
+def read_tsv(directory: str, name: str) -> Iterator[Dict[str, Union[str, None]]]:
+    """
+    Yield the rows of an IMDb dump, gzipped or not, with the IMDb null value \\N turned into None
+
+    :param directory: the folder with the dumps
+    :param name: the name of the dump, like title.basics
+    :return: an iterator of dicts mapping column names to values
+    """
+    path = os.path.join(directory, name + ".tsv.gz")
+    file = gzip.open(path, 'rt', encoding='utf-8', newline='') if os.path.exists(path) else \
+        open(os.path.join(directory, name + ".tsv"), 'r', encoding='utf-8', newline='')
+    with file:
+        reader = csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = next(reader)
+        for row in reader:
+            yield {k: (None if v == "\\N" else v) for k, v in zip(header, row)}
+
+
+def number(imdb_id: Union[str, int]) -> int:
+    """
+    Return the number of an IMDb id, like 133093 for tt0133093 or 0133093
+
+    :param imdb_id: the IMDb id, with or without prefix
+    :return: the number of the id
+    """
+    if isinstance(imdb_id, int):
+        return imdb_id
+    return int(imdb_id.lstrip("tnm"))
+
+
+def write_column(directory: str, name: str, typecode: str, values: Union[array, List]) -> None:
+    """
+    Write a column of numbers to a file, as a flat array that can be memory-mapped
+
+    :param directory: the index folder
+    :param name: the name of the column
+    :param typecode: the array typecode of the numbers
+    :param values: the numbers
+    """
+    with open(os.path.join(directory, name), 'wb') as file:
+        (values if isinstance(values, array) else array(typecode, values)).tofile(file)
+
+
+def write_strings(directory: str, name: str, values: List[bytes]) -> None:
+    """
+    Write a column of strings to two files, the concatenated strings and the offsets of each string
+
+    :param directory: the index folder
+    :param name: the name of the column
+    :param values: the utf-8 encoded strings
+    """
+    offsets = array('Q', [0])
+    with open(os.path.join(directory, name + ".text"), 'wb') as file:
+        for value in values:
+            file.write(value)
+            offsets.append(offsets[-1] + len(value))
+    write_column(directory, name + ".offsets", 'Q', offsets)
+
+
+def write_search(directory: str, name: str, texts: List[bytes]) -> None:
+    """
+    Write the search index of a column of strings: every key of every string, sorted, with the index of its string
+
+    :param directory: the index folder
+    :param name: the name of the search index
+    :param texts: the utf-8 encoded strings
+    """
+    entries = sorted((key.encode(), i) for i, text in enumerate(texts) for key in search_keys(text.decode()))
+    write_strings(directory, name + ".keys", [key for key, _ in entries])
+    write_column(directory, name + ".targets", 'I', [i for _, i in entries])
+
+
+def build(source: str, directory: str) -> Dict:
+    """
+    Build the indexes of the dataset from the IMDb dumps title.basics, title.ratings, title.principals and name.basics.
+    Only titles of the KINDS, the principals of the ROLES and the people among those principals are kept.
+
+    :param source: the folder with the dumps
+    :param directory: the folder to write the indexes to
+    :return: the metadata of the indexes, also written to meta.json
+    """
+    os.makedirs(directory, exist_ok=True)
+    kinds = list(KINDS.values())
+    roles = list(ROLES)
+
+    titles = sorted((number(row['tconst']), row['primaryTitle'] or "", row['startYear'], row['titleType'])
+                    for row in read_tsv(source, "title.basics") if row['titleType'] in KINDS)
+    index = {t[0]: i for i, t in enumerate(titles)}
+    write_column(directory, "title.ids", 'I', [t[0] for t in titles])
+    write_column(directory, "title.years", 'H', [int(t[2]) if t[2] else 0 for t in titles])
+    write_column(directory, "title.kinds", 'B', [kinds.index(KINDS[t[3]]) for t in titles])
+    texts = [t[1].encode() for t in titles]
+    del titles
+    write_strings(directory, "title", texts)
+    write_search(directory, "title.search", texts)
+    del texts
+
+    # Ratings are stored times ten, so they fit two bytes
+    ratings = array('H', bytes(2 * len(index)))
+    votes = array('I', bytes(4 * len(index)))
+    for row in read_tsv(source, "title.ratings"):
+        i = index.get(number(row['tconst']))
+        if i is not None:
+            ratings[i] = round(float(row['averageRating']) * 10)
+            votes[i] = int(row['numVotes'])
+    write_column(directory, "title.ratings", 'H', ratings)
+    write_column(directory, "title.votes", 'I', votes)
+
+    # The principals of each title are stored contiguously, the principals of title i are at offsets i to i + 1
+    owners, people, categories = array('I'), array('I'), array('B')
+    for row in read_tsv(source, "title.principals"):
+        i = index.get(number(row['tconst']))
+        if i is not None and row['category'] in ROLES:
+            owners.append(i)
+            people.append(number(row['nconst']))
+            categories.append(roles.index(row['category']))
+    offsets = array('Q', bytes(8 * (len(index) + 1)))
+    for i in owners:
+        offsets[i + 1] += 1
+    for i in range(len(index)):
+        offsets[i + 1] += offsets[i]
+    filled = array('Q', offsets)
+    principals, principal_roles = array('I', bytes(4 * len(owners))), array('B', bytes(len(owners)))
+    for i, person, category in zip(owners, people, categories):
+        principals[filled[i]] = person
+        principal_roles[filled[i]] = category
+        filled[i] += 1
+    write_column(directory, "title.principals.offsets", 'Q', offsets)
+    write_column(directory, "title.principals", 'I', principals)
+    write_column(directory, "title.principals.roles", 'B', principal_roles)
+    credits = Counter(people)
+    del owners, people, categories, offsets, filled, principals, principal_roles, index
+
+    names = sorted((number(row['nconst']), row['primaryName'] or "", row['birthYear'])
+                   for row in read_tsv(source, "name.basics") if number(row['nconst']) in credits)
+    write_column(directory, "name.ids", 'I', [n[0] for n in names])
+    write_column(directory, "name.births", 'H', [int(n[2]) if n[2] else 0 for n in names])
+    write_column(directory, "name.credits", 'I', [credits[n[0]] for n in names])
+    texts = [n[1].encode() for n in names]
+    write_strings(directory, "name", texts)
+    write_search(directory, "name.search", texts)
+
+    meta = {'version': 1, 'kinds': kinds, 'roles': roles, 'titles': len(votes), 'names': len(names)}
+    with open(os.path.join(directory, "meta.json"), 'w') as file:
+        json.dump(meta, file)
+    return meta
+
+
+class Strings(Sequence):
+    """
+    A memory-mapped column of strings
+    """
+    def __init__(self, offsets: memoryview, text: memoryview) -> None:
+        """
+        Initialize the column
+
+        :param offsets: the offsets of each string in the text, and the end of the text
+        :param text: the concatenated utf-8 encoded strings
+        """
+        self.offsets = offsets
+        self.text = text
+
+    def __len__(self) -> int:
+        """
+        Return the amount of strings.
+        Used to handle len() on the column
+
+        :return: the amount of strings
+        """
+        return len(self.offsets) - 1
+
+    def raw(self, index: int) -> bytes:
+        """
+        Return a string without decoding it
+
+        :param index: the index of the string
+        :return: the utf-8 encoded string
+        """
+        return bytes(self.text[self.offsets[index]:self.offsets[index + 1]])
+
+    def __getitem__(self, index: int) -> str:
+        """
+        Return a string.
+        Used to handle indexing the column
+
+        :param index: the index of the string
+        :return: the string
+        """
+        return self.raw(index).decode()
+
+
+class Dataset:
+    """
+    An IMDb data source answering from the memory-mapped indexes of the IMDb dataset dumps, see build().
+    It can be used in place of the IMDb() object of IMDbPy for the lookups the app makes, and returns the same
+    IMDbPy Movie and Person objects, filled with the title, year, cast and directors or name and birth year.
+    """
+    def __init__(self, directory: str) -> None:
+        """
+        Initialize the data source, the indexes are only mapped into memory when they are first needed
+
+        :param directory: the folder with the indexes
+        """
+        self.directory = directory
+        self.columns = None
+        self.maps = []
+        self.lock = threading.Lock()
+
+    def map(self, name: str, typecode: str = 'B') -> memoryview:
+        """
+        Map a file of the indexes into memory
+
+        :param name: the name of the file
+        :param typecode: the array typecode of the values in the file
+        :return: a read-only view of the values in the file
+        """
+        with open(os.path.join(self.directory, name), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return memoryview(array(typecode))
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    def open(self) -> Dict:
+        """
+        Return the columns of the indexes, mapping them into memory if needed
+
+        :return: a dict of columns by name
+        """
+        with self.lock:
+            if self.columns is None:
+                with open(os.path.join(self.directory, "meta.json")) as file:
+                    meta = json.load(file)
+                columns = {'kinds': meta['kinds'], 'roles': [ROLES[r] for r in meta['roles']]}
+                for name, typecode in [("title.ids", 'I'), ("title.years", 'H'), ("title.kinds", 'B'),
+                                       ("title.ratings", 'H'), ("title.votes", 'I'), ("title.principals", 'I'),
+                                       ("title.principals.offsets", 'Q'), ("title.principals.roles", 'B'),
+                                       ("title.search.targets", 'I'), ("name.ids", 'I'), ("name.births", 'H'),
+                                       ("name.credits", 'I'), ("name.search.targets", 'I')]:
+                    columns[name] = self.map(name, typecode)
+                for name in ("title", "title.search.keys", "name", "name.search.keys"):
+                    columns[name] = Strings(self.map(name + ".offsets", 'Q'), self.map(name + ".text"))
+                self.columns = columns
+            return self.columns
+
+    def find(self, ids: memoryview, imdb_id: Union[str, int]) -> Union[int, None]:
+        """
+        Return the index of an IMDb id in a sorted column of ids
+
+        :param ids: the column of ids
+        :param imdb_id: the IMDb id
+        :return: the index, or None if the id is not in the dataset
+        """
+        n = number(imdb_id)
+        i = bisect.bisect_left(ids, n)
+        return i if i < len(ids) and ids[i] == n else None
+
+    def movie(self, i: int, full: bool = False) -> Movie:
+        """
+        Return the IMDbPy object of the title at an index
+
+        :param i: the index of the title
+        :param full: whether to include the rating, cast and directors
+        :return: an IMDbPy movie
+        """
+        c = self.columns
+        movie = {'title': c['title'][i], 'kind': c['kinds'][c['title.kinds'][i]]}
+        if c['title.years'][i]:
+            movie['year'] = c['title.years'][i]
+        if full:
+            if c['title.votes'][i]:
+                movie['rating'] = c['title.ratings'][i] / 10
+                movie['votes'] = c['title.votes'][i]
+            movie['cast'], movie['directors'] = [], []
+            for p in range(c['title.principals.offsets'][i], c['title.principals.offsets'][i + 1]):
+                n = self.find(c['name.ids'], c['title.principals'][p])
+                if n is not None:
+                    movie[c['roles'][c['title.principals.roles'][p]]].append(self.person(n))
+        return Movie(movieID=f"{c['title.ids'][i]:07d}", data=movie)
+
+    def person(self, i: int) -> Person:
+        """
+        Return the IMDbPy object of the person at an index
+
+        :param i: the index of the person
+        :return: an IMDbPy person
+        """
+        c = self.columns
+        person = {'name': c['name'][i]}
+        if c['name.births'][i]:
+            person['birth date'] = str(c['name.births'][i])
+        return Person(personID=f"{c['name.ids'][i]:07d}", data=person)
+
+    def get_movie(self, movieID: Union[str, int], info: Tuple[str, ...] = ('main',)) -> Movie:
+        """
+        Return a movie by its IMDb id, with its title, year, kind, rating, cast and directors.
+        The dataset has no other sets of information, so info is ignored
+
+        :param movieID: the IMDb id of the movie
+        :param info: the sets of information to retrieve
+        :return: an IMDbPy movie
+        :raises IMDbDataAccessError: if the movie is not in the dataset
+        """
+        c = self.open()
+        i = self.find(c['title.ids'], movieID)
+        if i is None:
+            raise IMDbDataAccessError(f"movie {movieID} is not in the dataset")
+        return self.movie(i, full=True)
+
+    def get_person(self, personID: Union[str, int], info: Tuple[str, ...] = ('main',)) -> Person:
+        """
+        Return a person by their IMDb id, with their name and birth year.
+        The dataset has no other sets of information, so info is ignored
+
+        :param personID: the IMDb id of the person
+        :param info: the sets of information to retrieve
+        :return: an IMDbPy person
+        :raises IMDbDataAccessError: if the person is not in the dataset
+        """
+        c = self.open()
+        i = self.find(c['name.ids'], personID)
+        if i is None:
+            raise IMDbDataAccessError(f"person {personID} is not in the dataset")
+        return self.person(i)
+
+    def search(self, name: str, query: str, rank: memoryview, results: int) -> List[int]:
+        """
+        Return the indexes of the strings whose keys start with a query, exact matches first, then by rank
+
+        :param name: the name of the search index
+        :param query: the query
+        :param rank: the column to rank matches by, highest first
+        :param results: the most indexes to return
+        :return: a list of indexes
+        """
+        c = self.open()
+        keys, targets = c[name + ".keys"], c[name + ".targets"]
+        key = normalize(query).encode()
+        if not key:
+            return []
+        positions = range(len(keys))
+        start = bisect.bisect_left(positions, key, key=keys.raw)
+        hi = min(len(keys), start + SCAN_LIMIT)
+        # Keys equal to the query come first among the keys starting with it,
+        # and no utf-8 encoded string contains the byte 0xff, so this is past every key starting with the query
+        exact = bisect.bisect_right(positions, key, lo=start, hi=hi, key=keys.raw)
+        stop = bisect.bisect_left(positions, key + b"\xff", lo=exact, hi=hi, key=keys.raw)
+        ranked = sorted(targets[start:exact], key=rank.__getitem__, reverse=True)
+        if len(ranked) < results:
+            ranked += heapq.nlargest(results, targets[exact:stop], key=rank.__getitem__)
+        # A string can be found by two keys, like "the matrix" and "matrix", so it may come up twice
+        return list(dict.fromkeys(ranked))[:results]
+
+    def search_movie(self, title: str, results: int = 20) -> List[Movie]:
+        """
+        Return the movies whose title, or title without leading article, starts with a query.
+        Exact matches come first, then the movies with the most votes
+
+        :param title: the query
+        :param results: the most movies to return
+        :return: a list of IMDbPy movies with their title, year and kind
+        """
+        c = self.open()
+        return [self.movie(i) for i in self.search("title.search", title, c['title.votes'], results)]
+
+    def search_person(self, name: str, results: int = 20) -> List[Person]:
+        """
+        Return the people whose name starts with a query.
+        Exact matches come first, then the people with the most credits
+
+        :param name: the query
+        :param results: the most people to return
+        :return: a list of IMDbPy people with their name and birth year
+        """
+        c = self.open()
+        return [self.person(i) for i in self.search("name.search", name, c['name.credits'], results)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python offline.py <folder with the IMDb dumps> <index folder>")
+    print(build(sys.argv[1], sys.argv[2]))
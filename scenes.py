@@ -1,12 +1,21 @@
 import pygame
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from uielements import *
 import data
-from algorithm import WeightedPattern
+from algorithm import WeightedPattern, NUMPY
 
 # This module contains all of the scenes used by the Movie predictor
 
 
+# The worker threads running predictions and p-value calculations, so the main loop keeps drawing frames while they run
+prediction_pool = ThreadPoolExecutor(max_workers=2)
+
+# The queued and running predictions. Kept here instead of on a PredictorScene, so predictions go on
+# while the user is in another scene and are presented when the user comes back
+prediction_jobs = []
+
+
 # Main Classes:
 
 # Controls the scenes and handles transitions between them
@@ -31,6 +40,8 @@ class Director:
         """
         self.scene = scene
         self.scene.director = self
+        # The screen still shows the previous scene, so the new one is drawn in full
+        self.scene.drawn = None
 
 
 # Scene base class
@@ -45,6 +56,9 @@ class Scene:
         """
         self.director = None
         self.ui = {}
+        # The state of the scene and of every UI element when they were last drawn to the screen, see draw()
+        self.drawn = None
+        self.drawnstate = None
 
     def handle_events(self, events):
         """
@@ -61,6 +75,39 @@ class Scene:
         """
         pass
 
+    def state(self):
+        """
+        Return everything drawn by render() besides the UI elements, so the scene is only drawn in full again
+        when this changed
+
+        :return: a tuple of the state
+        """
+        return ()
+
+    def draw(self, surface):
+        """
+        Draw what changed since this scene was last drawn to the given surface, which still shows the last frame.
+        Draws the scene in full when it was just switched to or its own state changed,
+        otherwise only the UI elements whose state changed
+
+        :param surface: the surface to draw to
+        :return: a list of the rects of the surface that changed, empty when nothing did
+        """
+        state = self.state()
+        if self.drawn is None or state != self.drawnstate:
+            self.render(surface)
+            self.drawn = {name: element.state() for name, element in self.ui.items()}
+            self.drawnstate = state
+            return [surface.get_rect()]
+        rects = []
+        for name, element in self.ui.items():
+            elementstate = element.state()
+            if elementstate != self.drawn.get(name):
+                surface.blit(element.render(), element.rect.topleft)
+                self.drawn[name] = elementstate
+                rects.append(element.rect)
+        return rects
+
     def render(self, surface):
         """
         Draw to the given surface
@@ -96,6 +143,57 @@ class Scene:
         func(*args)
 
 
+# Base class of scenes shown on top of another scene
+class Overlay(Scene):
+    """
+    A scene shown on top of the scene it was opened from, which is shown dimmed behind it.
+    The dimmed scene is rendered once when the overlay is first shown, every later frame reuses that snapshot
+    """
+
+    def __init__(self, background):
+        """
+        Initialize the overlay
+
+        :param background: the scene to show behind the overlay, and to return to
+        """
+        super().__init__()
+        self.background = background
+        self.snapshot = None
+
+    def render_background(self, surface):
+        """
+        Draw the dimmed background scene to the given surface, rendering it only the first time
+
+        :param surface: the surface to draw to
+        """
+        if self.snapshot is None or self.snapshot.get_size() != surface.get_size():
+            self.background.render(surface)
+            surface.blit(veil(surface.get_size(), 150), (0, 0))
+            self.snapshot = surface.copy()
+        else:
+            surface.blit(self.snapshot, (0, 0))
+
+
+# The veils dimming scenes, by size and alpha
+veils = {}
+
+
+def veil(size, alpha):
+    """
+    Return a surface to dim a scene with, creating it only the first time it is asked for
+
+    :param size: the size of the surface
+    :param alpha: the opacity of the surface
+    :return: the veil surface
+    """
+    if (size, alpha) not in veils:
+        surface = pygame.Surface(size)
+        surface.fill((20, 20, 20))
+        surface.set_alpha(alpha)
+        veils[(size, alpha)] = surface
+    return veils[(size, alpha)]
+
+
 """
 From this point forward there will be no docstrings for handle_events(), update(), and render()
 as they have already been described above
@@ -127,9 +225,63 @@ class MenuScene(Scene):
         text(surface, "by Jonathan Williams", (50, 100), regularfont, (255, 255, 0))
 
 
+# A prediction for a single movie, running on a worker thread
+class PredictionJob:
+    """
+    A prediction of a movie that runs on a worker thread and reports its progress
+    """
+    def __init__(self, entry):
+        """
+        Initialize the job and queue it on the prediction workers
+
+        :param entry: the movie to predict, as found in the search box
+        """
+        self.entry = entry
+        self.progress = "queued"
+        self.result = None
+        self.error = None
+        self.future = prediction_pool.submit(self.run)
+
+    def run(self):
+        """
+        Execute the prediction and save the results of said prediction. Runs on a worker thread
+        """
+        try:
+            self.progress = "fetching cast"
+            movie = data.update_movie(self.entry.id, ['main'])
+            cast = movie.cast[:10]
+            wp = WeightedPattern(len(cast), NUMPY)
+            for c, person in enumerate(cast):
+                self.progress = f"scoring {c + 1}/{len(cast)}"
+                wp.add_row(person)
+            score = wp.score(cast) / wp.length
+            self.progress = "saving"
+            result = float(f"{score:.1f}")
+            savedata = data.load_movie_ratings()
+            if movie.id in savedata:
+                data.save_movie_rating(movie.id, result, savedata[movie.id][1])
+            else:
+                data.save_movie_rating(movie.id, result, 0)
+            self.result = (movie, cast, score)
+            self.progress = "done"
+        except Exception as error:
+            # Kept so the failure can be shown and looked into
+            self.error = error
+            self.progress = f"failed: {error}"
+
+    def done(self):
+        """
+        Return whether the prediction finished successfully
+
+        :return: whether the result is ready
+        """
+        return self.result is not None
+
+
 class PredictorScene(Scene):
     """
-    The scene where the user can select a movie to predict a score
+    The scene where the user can select a movie to predict a score.
+    Predictions run in the background, several movies can be queued at once
     """
     def __init__(self):
         super().__init__()
@@ -142,27 +294,38 @@ class PredictorScene(Scene):
     def handle_events(self, events):
         super().handle_events(events)
 
+    def update(self):
+        # Present the first finished prediction, the others wait until the user returns to this scene
+        for job in prediction_jobs:
+            if job.done():
+                prediction_jobs.remove(job)
+                self.director.switch(PredictResultScene(job.result[0], job.result[1], job.result[2], self))
+                return
+
+    def state(self):
+        return tuple((job.entry, job.progress) for job in prediction_jobs[:10])
+
     def render(self, surface):
         super().render(surface)
 
-        text(surface, "Predict Enjoyment", (40, 40), titlefont, (255, 255, 0))
+        yellow = (255, 255, 0)
+        text(surface, "Predict Enjoyment", (40, 40), titlefont, yellow)
+
+        # The queue of running predictions
+        if prediction_jobs:
+            text(surface, "Queue", (1245, 150), subtitlefont, yellow)
+        for i, job in enumerate(prediction_jobs[:10]):
+            text(surface, job.entry.basic_info()['title'][:16], (1245, 195 + (i * 50)), regularfont, yellow)
+            text(surface, job.progress[:16], (1255, 218 + (i * 50)), regularfont, yellow)
 
     def predict(self):
         """
-        Execute the prediction, save the results of said prediction and switch to the PredictResultScene()
-        """
-        movie = data.update_movie(self.ui['search'].outputtable.get_selected().id, ['main'])
-        cast = movie.cast[:10]
-        wp = WeightedPattern(len(cast))
-        for person in cast:
-            wp.add_row(person)
-        result = float(f"{wp.score(cast) / wp.length:.1f}")
-        savedata = data.load_movie_ratings()
-        if movie.id in savedata:
-            data.save_movie_rating(movie.id, result, savedata[movie.id][1])
-        else:
-            data.save_movie_rating(movie.id, result, 0)
-        self.director.switch(PredictResultScene(movie, cast, wp.score(cast) / wp.length, self))
+        Queue a prediction of the selected movie, which switches to the PredictResultScene() when done
+        """
+        entry = self.ui['search'].outputtable.get_selected()
+        if entry is not None:
+            prediction_jobs[:] = [job for job in prediction_jobs if job.error is None]
+            prediction_jobs.append(PredictionJob(entry))
 
 
 class PValueScene(Scene):
@@ -180,10 +343,26 @@ class PValueScene(Scene):
         }
         self.ui['table'].selectable = False
         self.error = ""
+        # The running calculation, see calculate()
+        self.calculation = None
 
     def handle_events(self, events):
         super().handle_events(events)
 
+    def update(self):
+        if self.calculation is not None and self.calculation.done():
+            calculation, self.calculation = self.calculation, None
+            try:
+                result = calculation.result()
+            except Exception as error:
+                self.error = f"Error: {error}"
+                return
+            self.error = ""
+            self.director.switch(PValueResultScene(result, self))
+
+    def state(self):
+        return self.error,
+
     def render(self, surface):
         super().render(surface)
 
@@ -200,19 +379,30 @@ class PValueScene(Scene):
 
     def calculate(self):
         """
-        Execute the calculation of the p-value and switch to the PValueResultScene()
-        :return:
+        Start the calculation of the p-value on a worker thread, which switches to the PValueResultScene() when done.
+        Without numpy large tables take seconds, the scene keeps responding meanwhile
         """
-        entries = self.ui['table'].entries
-        if len(entries) < 8:
-            self.error = ""
-            wp = WeightedPattern(len(entries))
-            for entry in entries:
-                wp.add_row(entries[entry])
-                print(wp.matrix[entry])
-            self.director.switch(PValueResultScene(wp.pvalue(7.0 * len(entries)), self))
-        else:
-            self.error = "Error: Having 8 or more entries takes too long to calculate..."
+        if self.calculation is not None:
+            return
+        entries = list(self.ui['table'].entries.values())
+        if len(entries) == 0:
+            self.error = "Error: Add at least one actor to the table first..."
+            return
+        self.error = "Calculating..."
+        self.calculation = prediction_pool.submit(self.pvalue, entries)
+
+    @staticmethod
+    def pvalue(entries):
+        """
+        Return the p-value of a set of actors. Runs on a worker thread
+
+        :param entries: the actors
+        :return: the chance that the actors score above 7.0 on average [0...1]
+        """
+        wp = WeightedPattern(len(entries), NUMPY)
+        for entry in entries:
+            wp.add_row(entry)
+        return wp.pvalue(7.0 * len(entries))
 
 
 class RateScene(Scene):
@@ -245,16 +435,15 @@ class RateScene(Scene):
 
 
 # Overlay scenes
-class PredictResultScene(Scene):
+class PredictResultScene(Overlay):
     """
     The scene that presents the results of a movie prediction, and queries the user to rate the movie
     """
     def __init__(self, entry, cast, result, background):
-        super().__init__()
+        super().__init__(background)
         self.entry = entry
         self.cast = cast
         self.result = result
-        self.background = background
         self.error = [""]
         self.ui = {
             'return': Button(pygame.Rect(485, 500, 215, 30), "Return", [None], [self.background], self),
@@ -269,13 +458,11 @@ class PredictResultScene(Scene):
     def handle_events(self, events):
         super().handle_events(events)
 
+    def state(self):
+        return tuple(self.error)
+
     def render(self, surface):
-        self.background.render(surface)
-        sr = pygame.display.get_surface().get_rect()
-        veil = pygame.Surface(sr.size)
-        pygame.draw.rect(veil, (20, 20, 20), surface.get_rect())
-        veil.set_alpha(150)
-        surface.blit(veil, (0, 0))
+        self.render_background(surface)
         yellow = (255, 255, 0)
 
         pygame.draw.rect(surface, (40, 40, 40), pygame.Rect(475, 250, 500, 300))
@@ -294,7 +481,7 @@ class PredictResultScene(Scene):
 
     def apply(self):
         """
-        Gets the rating from the text box and, if valid, saves the rating to the csv files
+        Gets the rating from the text box and, if valid, saves the rating to the ratings database
         """
         score = self.ui['text'].get_text()
         try:
@@ -307,24 +494,25 @@ class PredictResultScene(Scene):
             else:
                 data.save_movie_rating(self.entry.id, 0, rating)
             personsavedata = data.load_person_ratings()
+            updates = {}
             for c in self.cast:
                 if c.id in personsavedata:
-                    data.save_person_rating(c.id, personsavedata[c.id][0], [*personsavedata[c.id][1], rating])
+                    updates[c.id] = (personsavedata[c.id][0], [*personsavedata[c.id][1], rating])
                 else:
-                    data.save_person_rating(c.id, "null", [rating])
+                    updates[c.id] = ("null", [rating])
+            data.save_person_ratings_bulk(updates)
             self.error = ["Rating saved succesfully"]
         except ValueError:
             self.error = ["Error: Input is not a number", "       between 1.0 and 10.0"]
 
 
-class PValueResultScene(Scene):
+class PValueResultScene(Overlay):
     """
     The scene that presents the results of the p-value calculation
     """
     def __init__(self, result, background):
-        super().__init__()
+        super().__init__(background)
         self.result = result
-        self.background = background
         self.error = [""]
         self.ui = {
             'return': Button(pygame.Rect(500, 500, 450, 30), "Return", [None], [self.background], self)
@@ -337,13 +525,11 @@ class PValueResultScene(Scene):
     def handle_events(self, events):
         super().handle_events(events)
 
+    def state(self):
+        return tuple(self.error)
+
     def render(self, surface):
-        self.background.render(surface)
-        sr = pygame.display.get_surface().get_rect()
-        veil = pygame.Surface(sr.size)
-        pygame.draw.rect(veil, (20, 20, 20), surface.get_rect())
-        veil.set_alpha(150)
-        surface.blit(veil, (0, 0))
+        self.render_background(surface)
         yellow = (255, 255, 0)
 
         pygame.draw.rect(surface, (40, 40, 40), pygame.Rect(475, 250, 500, 300))
@@ -359,14 +545,13 @@ class PValueResultScene(Scene):
             surface.blit(element.render(), element.rect.topleft)
 
 
-class ApplyRateScene(Scene):
+class ApplyRateScene(Overlay):
     """
     The scene where the user can apply a rating to a selected actor
     """
     def __init__(self, entry, background):
-        super().__init__()
+        super().__init__(background)
         self.entry = entry
-        self.background = background
         self.error = [""]
         self.ui = {
             'return': Button(pygame.Rect(485, 500, 215, 30), "Return", [None], [self.background], self),
@@ -381,13 +566,12 @@ class ApplyRateScene(Scene):
     def handle_events(self, events):
         super().handle_events(events)
 
+    def state(self):
+        savedata = data.load_person_ratings()
+        return tuple(self.error), savedata[self.entry.id][0] if self.entry.id in savedata else None
+
     def render(self, surface):
-        self.background.render(surface)
-        sr = pygame.display.get_surface().get_rect()
-        veil = pygame.Surface(sr.size)
-        pygame.draw.rect(veil, (20, 20, 20), surface.get_rect())
-        veil.set_alpha(150)
-        surface.blit(veil, (0, 0))
+        self.render_background(surface)
         yellow = (255, 255, 0)
 
         pygame.draw.rect(surface, (40, 40, 40), pygame.Rect(475, 250, 500, 300))
@@ -409,7 +593,7 @@ class ApplyRateScene(Scene):
 
     def apply(self):
         """
-        Gets the rating from the text box and, if valid, saves the rating to the csv files
+        Gets the rating from the text box and, if valid, saves the rating to the ratings database
         """
         score = self.ui['text'].get_text()
         try:
@@ -426,14 +610,13 @@ class ApplyRateScene(Scene):
             self.error = ["Error: Input is not a number", "       between 1.0 and 10.0"]
 
 
-class InfoScene(Scene):
+class InfoScene(Overlay):
     """
     Displays information on a given movie or actor
     """
     def __init__(self, entry, background):
-        super().__init__()
+        super().__init__(background)
         self.entry = data.update_movie(entry.id, ['main']) if isinstance(entry, data.Movie) else data.update_person(entry.id, ['main'])
-        self.background = background
         self.ui = {
             'return': Button(pygame.Rect(150, 670, 300, 30), "Return", [None], [self.background], self)
         }
@@ -445,13 +628,14 @@ class InfoScene(Scene):
     def handle_events(self, events):
         super().handle_events(events)
 
+    def state(self):
+        # The poster or headshot is drawn once it finished downloading
+        if isinstance(self.entry, data.Movie):
+            return self.entry.poster is not None,
+        return self.entry.headshot is not None,
+
     def render(self, surface):
-        self.background.render(surface)
-        sr = pygame.display.get_surface().get_rect()
-        veil = pygame.Surface(sr.size)
-        pygame.draw.rect(veil, (20, 20, 20), surface.get_rect())
-        veil.set_alpha(150)
-        surface.blit(veil, (0, 0))
+        self.render_background(surface)
         yellow = (255, 255, 0)
 
         pygame.draw.rect(surface, (40, 40, 40), pygame.Rect(150, 150, 1150, 500))
@@ -496,21 +680,31 @@ class Fader(Scene):
         self.fade = 0
         sr = pygame.display.get_surface().get_rect()
         self.veil = pygame.Surface(sr.size)
+        self.veil.fill((20, 20, 20))
+        # Each scene is rendered once and faded from that snapshot
+        self.snapshot = None
 
     def handle_events(self, events):
         # The fader is meant to go uninterrupted, so event handling is disabled.
         pass
 
+    def state(self):
+        return self.current, self.fade
+
     def update(self):
         self.fade = self.fade + 15 if self.fadein else self.fade - 15
         if self.fade >= 255:
             self.fadein = False
             self.current = self.next
+            self.snapshot = None
         if self.fade <= 0:
             self.director.switch(self.next)
 
     def render(self, surface):
-        self.current.render(surface)
-        pygame.draw.rect(self.veil, (20, 20, 20), surface.get_rect())
+        if self.snapshot is None or self.snapshot.get_size() != surface.get_size():
+            self.current.render(surface)
+            self.snapshot = surface.copy()
+        else:
+            surface.blit(self.snapshot, (0, 0))
         self.veil.set_alpha(self.fade)
         surface.blit(self.veil, (0, 0))
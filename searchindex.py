@@ -0,0 +1,293 @@
+from typing import List, Tuple, Iterable, Hashable
+from array import array
+from itertools import islice
+import gc, heapq, math, threading, time
+from offline import normalize, ARTICLES
+
+# This module contains the local search index used to search titles and names while they are being typed, see data.py
+
+# The most postings looked at for a single query, so a query matching almost everything can't take long
+SCAN_LIMIT = 5000
+
+# The most strings stored at once, searches wait at most for this many to be stored
+ADD_CHUNK = 500
+
+# The most strings sorted at once while compacting
+SORT_CHUNK = 10000
+
+# The amount of dicts the positions of the strings are spread over. Growing or freeing a single dict
+# of millions of strings takes long enough to keep searches on other threads from running
+POSITION_SHARDS = 64
+
+# The most strings of the old index let go of at once after a compaction
+FREE_CHUNK = 50000
+
+# The fraction of the n-grams of a query a string needs to have to be a fuzzy match
+FUZZY = 0.5
+
+
+def ngrams(key: str, prefix: bool = False) -> List[str]:
+    """
+    Return the n-grams of a normalized title or name: every trigram of the text padded with spaces,
+    and the space and first letter of every word, so a single letter can be looked up as well.
+
+    :param key: the normalized text, see offline.normalize()
+    :param prefix: whether the last word may still go on, as it does while typing, so it isn't padded at the end
+    :return: a list of the unique n-grams
+    """
+    padded = " " + key + ("" if prefix else " ")
+    grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    grams.update(" " + word[0] for word in key.split())
+    return list(grams)
+
+
+def shard(positions: List[dict], id_: Hashable) -> dict:
+    """
+    Return the dict holding the position of a string in an index, see SearchIndex
+
+    :param positions: the dicts of positions of the index
+    :param id_: the id of the string
+    :return: the dict mapping the id to the position, if the string is in the index
+    """
+    # Hashed as a tuple, as numbers hash to themselves, so consecutive ids would fill every dict at the same pace
+    # and make them all grow at the same time
+    return positions[hash((id_,)) % len(positions)]
+
+
+def tier(text: str, key: str) -> int:
+    """
+    Return how well a string matches a query it has a word starting with, ignoring a leading article:
+    2 if it is equal to the query, 1 if it starts with the query and 0 otherwise
+
+    :param text: the normalized string padded with spaces, as stored in the index
+    :param key: the normalized query
+    :return: the tier of the match
+    """
+    text = text[1:-1]
+    for article in ARTICLES:
+        if text.startswith(article) and not key.startswith(article):
+            text = text[len(article):]
+            break
+    return 2 if text == key else 1 if text.startswith(key) else 0
+
+
+class SearchIndex:
+    """
+    An n-gram index of titles or names, answering ranked fuzzy queries in a few milliseconds even for millions of them.
+    The postings of every n-gram are kept in order of weight (like the amount of votes) as far as possible,
+    so a query can stop after the first good matches instead of looking at every string sharing an n-gram.
+    Strings added after the last compaction come after the others until the index is compacted again.
+    """
+    def __init__(self) -> None:
+        """
+        Initialize an empty index
+        """
+        self.ids = []
+        self.texts = []
+        self.items = []
+        self.weights = array('Q')
+        self.positions = [{} for _ in range(POSITION_SHARDS)]
+        self.postings = {}
+        self.compacted = 0
+        # The positions of strings updated during a compaction, or None when the index isn't being compacted
+        self.changed = None
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        """
+        Return the amount of strings in the index.
+        Used to handle len() on the index
+
+        :return: the amount of strings
+        """
+        return len(self.ids)
+
+    def add(self, id_: Hashable, text: str, item: object, weight: int = 0) -> None:
+        """
+        Add a string to the index, or update the item and weight of a string that is already in it
+
+        :param id_: the id of the string, like an IMDb id
+        :param text: the title or name
+        :param item: what to return when the string is found
+        :param weight: how strongly to prefer the string over other matches, like its amount of votes
+        """
+        self.add_many([(id_, text, item, weight)])
+
+    def add_many(self, strings: Iterable[Tuple[Hashable, str, object, int]]) -> None:
+        """
+        Add many strings to the index at once, see add().
+        Compacts the index when it grew by more than a quarter since the last compaction
+
+        :param strings: tuples of an id, a title or name, an item and a weight
+        """
+        strings = iter(strings)
+        while True:
+            # The n-grams are made without holding the lock, so searches only wait for a chunk to be stored.
+            # Small chunks also keep the garbage collector from pausing every thread to look at millions of them
+            prepared = [(id_, text, None if id_ in shard(self.positions, id_) else normalize(text or ""), item, weight)
+                        for id_, text, item, weight in islice(strings, ADD_CHUNK)]
+            if not prepared:
+                break
+            self.store([(id_, text, key, ngrams(key) if key else (), item, weight)
+                        for id_, text, key, item, weight in prepared])
+            # Let a search waiting for the lock go first
+            time.sleep(0)
+        with self.lock:
+            compact = self.changed is None and len(self) - self.compacted > max(1000, self.compacted // 4)
+            if compact:
+                self.changed = []
+        if compact:
+            self.compact()
+
+    def store(self, prepared: List[Tuple[Hashable, str, str, List[str], object, int]]) -> None:
+        """
+        Store strings whose n-grams were made already, see add_many()
+
+        :param prepared: tuples of an id, a title or name, the normalized text or None if it wasn't normalized
+                         because the id was already in the index, the n-grams, an item and a weight
+        """
+        with self.lock:
+            for id_, text, key, grams, item, weight in prepared:
+                position = shard(self.positions, id_).get(id_)
+                if position is not None:
+                    self.items[position] = item
+                    self.weights[position] = max(self.weights[position], weight)
+                    if self.changed is not None:
+                        self.changed.append(position)
+                    continue
+                if key is None:
+                    key = normalize(text or "")
+                    grams = ngrams(key)
+                if not key:
+                    continue
+                position = shard(self.positions, id_)[id_] = len(self.ids)
+                self.ids.append(id_)
+                self.texts.append(" " + key + " ")
+                self.items.append(item)
+                self.weights.append(weight)
+                for gram in grams:
+                    self.postings.setdefault(gram, array('I')).append(position)
+
+    def compact(self) -> None:
+        """
+        Renumber the strings from the highest to the lowest weight and rebuild the postings in that order.
+        The new index is built without holding the lock and swapped in when done.
+        Strings added meanwhile come after the others, and strings updated meanwhile are updated in the new index
+        """
+        with self.lock:
+            if self.changed is None:
+                self.changed = []
+            size = len(self)
+            # Only appended to until the swap, so the first strings can be read without the lock
+            ids, texts, items, weights = self.ids, self.texts, self.items, self.weights
+        try:
+            # Sorted in chunks and merged, so a long sort doesn't keep searches on other threads from running
+            # Arrays rather than lists, so there are no millions of numbers to free at once afterwards
+            chunks = [array('I', sorted(range(i, min(size, i + SORT_CHUNK)), key=weights.__getitem__, reverse=True))
+                      for i in range(0, size, SORT_CHUNK)]
+            order = array('I', heapq.merge(*chunks, key=weights.__getitem__, reverse=True))
+            renumbered = array('I', bytes(4 * size))
+            for new, old in enumerate(order):
+                renumbered[old] = new
+            compacted = [[ids[i] for i in order], [texts[i] for i in order], [items[i] for i in order],
+                         array('Q'), [{} for _ in range(POSITION_SHARDS)], {}]
+            for start in range(0, size, ADD_CHUNK):
+                compacted[3].extend([weights[i] for i in order[start:start + ADD_CHUNK]])
+            self.append_to(compacted, 0, size)
+            # Catch up with the strings added meanwhile, only holding the lock for the last few of them
+            done = size
+            while True:
+                with self.lock:
+                    stop = len(self)
+                    if stop - done <= ADD_CHUNK:
+                        self.append_to(compacted, done, stop, copy=True)
+                        for position in self.changed:
+                            new = renumbered[position] if position < size else position
+                            compacted[2][new] = self.items[position]
+                            compacted[3][new] = self.weights[position]
+                        positions = self.positions
+                        self.ids, self.texts, self.items, self.weights, self.positions, self.postings = compacted
+                        self.compacted = size
+                        break
+                self.append_to(compacted, done, stop, copy=True)
+                done = stop
+        finally:
+            self.changed = None
+        # A full garbage collection looks at every string in the index, which pauses every thread for a long time
+        # once there are millions of them. Frozen objects are left out of it, and are still freed when unused
+        gc.freeze()
+        # Freeing the old index at once would take long as well, so it is freed a part at a time.
+        # The strings themselves are in the new index, only the references to them are dropped
+        for part, step in [(ids, FREE_CHUNK), (texts, FREE_CHUNK), (items, FREE_CHUNK), (positions, 1)]:
+            while part:
+                del part[-step:]
+                time.sleep(0)
+
+    def append_to(self, compacted: List, start: int, stop: int, copy: bool = False) -> None:
+        """
+        Add the positions and postings of a range of strings to an index being compacted, see compact()
+
+        :param compacted: the ids, texts, items, weights, positions and postings of the new index
+        :param start: the first position in the new index
+        :param stop: the position after the last one
+        :param copy: whether to copy the strings from this index first, as for strings added during compaction
+        """
+        ids, texts, items, weights, positions, postings = compacted
+        if copy:
+            ids.extend(self.ids[start:stop])
+            texts.extend(self.texts[start:stop])
+            items.extend(self.items[start:stop])
+            weights.extend(self.weights[start:stop])
+        for position in range(start, stop):
+            shard(positions, ids[position])[ids[position]] = position
+            for gram in ngrams(texts[position][1:-1]):
+                postings.setdefault(gram, array('I')).append(position)
+
+    def search(self, query: str, amount: int) -> List[object]:
+        """
+        Return the items of the strings best matching a query that may still be being typed.
+        Strings equal to the query come first, then strings starting with it, then strings with a word starting
+        with it, each by weight. When there are not enough of those, fuzzy matches sharing most n-grams follow.
+
+        :param query: the query
+        :param amount: the most items to return
+        :return: a list of items
+        """
+        key = normalize(query)
+        if not key:
+            return []
+        grams = ngrams(key, prefix=True)
+        with self.lock:
+            postings = sorted((self.postings.get(g, ()) for g in grams), key=len)
+            word = " " + key
+            matches = {}
+            scanned = 0
+            # Every match has the rarest n-gram, and its postings are in order of weight, so the first matches are best
+            for i in postings[0]:
+                text = self.texts[i]
+                if word in text:
+                    matches[i] = tier(text, key)
+                    if len(matches) >= amount * 4:
+                        break
+                scanned += 1
+                if scanned >= SCAN_LIMIT:
+                    break
+            if len(matches) < amount:
+                # A fuzzy match shares enough n-grams, so it has at least one of the rarest few of them.
+                # Rare n-grams tell the most about a string, so the matches found first are the closest
+                needed = math.ceil(len(grams) * FUZZY)
+                fuzzy = amount * 4 - len(matches)
+                for posting in postings[:len(grams) - needed + 1]:
+                    for i in posting[:max(0, SCAN_LIMIT - scanned)]:
+                        if i not in matches:
+                            shared = sum(map(self.texts[i].__contains__, grams))
+                            if shared >= needed:
+                                matches[i] = shared / len(grams) - 1
+                                fuzzy -= 1
+                                if fuzzy == 0:
+                                    break
+                    scanned += len(posting)
+                    if fuzzy <= 0:
+                        break
+            best = sorted(matches, key=lambda i: (matches[i], self.weights[i]), reverse=True)[:amount]
+            return [self.items[i] for i in best]
@@ -1,21 +1,93 @@
 import pygame
 import data
 import scenes
-from typing import Tuple, Callable, List, Union
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Tuple, Callable, List, Union, Dict
 
 # This module contains elements used by the UI (buttons, etc.)
 
 
 pygame.freetype.init()
 regularfont = pygame.freetype.SysFont('Mono', 20)
+smallfont = pygame.freetype.SysFont('Mono', 15)
+iconfont = pygame.freetype.SysFont('Mono', 50)
 titlefont = pygame.freetype.Font("schoolgirls.otf", 60)
 subtitlefont = pygame.freetype.Font("schoolgirls.otf", 30)
 
+# The worker threads running searches, so the main loop keeps drawing frames while IMDbPy is queried
+search_pool = ThreadPoolExecutor(max_workers=2)
+
+# The seconds the text of a search box has to stay unchanged before IMDbPy is searched for what wasn't found locally
+FALLBACK_DELAY = 0.6
+
+
+class TextCache:
+    """
+    A cache of rendered text, keyed by font, size, message and color.
+    The least recently used surfaces are evicted when they take more memory than the budget.
+    Counts how many renders were saved, in total and in the last frame, see end_frame()
+    """
+    def __init__(self, budget: int = 16 * 1024 * 1024) -> None:
+        """
+        Initialize an empty cache
+
+        :param budget: the most bytes of surfaces to keep
+        """
+        self.budget = budget
+        self.surfaces = OrderedDict()
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.frame = {'hits': 0, 'misses': 0}
+        self.last_frame = dict(self.frame)
+
+    def render(self, font: pygame.freetype.Font, message: str, color: Tuple[int, int, int]) -> Tuple[pygame.Surface, pygame.Rect]:
+        """
+        Return rendered text, rendering it only if it is not cached.
+        The surface is shared, so it should not be drawn on
+
+        :param font: the font to render the text with
+        :param message: the text to render
+        :param color: the color of the text
+        :return: the surface and the bounding rect of the text, like font.render()
+        """
+        key = (font, font.size, message, tuple(color))
+        if key in self.surfaces:
+            self.surfaces.move_to_end(key)
+            self.stats['hits'] += 1
+            self.frame['hits'] += 1
+            return self.surfaces[key][:2]
+        surface, rect = font.render(message, color)
+        size = surface.get_width() * surface.get_height() * surface.get_bytesize()
+        self.surfaces[key] = (surface, rect, size)
+        self.size += size
+        self.stats['misses'] += 1
+        self.frame['misses'] += 1
+        while self.size > self.budget and len(self.surfaces) > 1:
+            self.size -= self.surfaces.popitem(last=False)[1][2]
+            self.stats['evictions'] += 1
+        return surface, rect
+
+    def end_frame(self) -> Dict[str, int]:
+        """
+        Start counting the renders of a new frame. Called by the main loop after every frame
+
+        :return: the hits (renders saved) and misses of the frame that ended
+        """
+        self.last_frame, self.frame = self.frame, {'hits': 0, 'misses': 0}
+        return self.last_frame
+
+
+# The rendered text of every element and scene
+text_cache = TextCache()
+
 
 # Add text to a surface
 def text(surface: pygame.Surface, message: str, pos: Tuple[int, int], font: pygame.freetype, color: Tuple[int, int, int]) -> None:
     """
-    Draws text to a given surface
+    Draws text to a given surface, reusing the rendered text of earlier frames, see TextCache
 
     :param surface: the surface to draw to
     :param message: the text to draw
@@ -23,7 +95,7 @@ def text(surface: pygame.Surface, message: str, pos: Tuple[int, int], font: pyga
     :param font: the font to draw the text with
     :param color: the color of the text
     """
-    t, _ = font.render(message, color)
+    t, _ = text_cache.render(font, message, color)
     surface.blit(t, pos)
 
 
@@ -56,6 +128,14 @@ class Button:
             # Become lighter when no mouse is hovering over button
             self.color = tuple([self.color[i] + 2 if self.color[i] < 40 else self.color[i] for i in range(3)])
 
+    def state(self) -> Tuple:
+        """
+        Return everything the rendered button depends on, so it only has to be drawn again when this changed
+
+        :return: a tuple of the state
+        """
+        return self.rect.size, self.text, self.color, self.bordercolor, self.textcolor
+
     # Draw the button
     def render(self) -> None:
         """
@@ -70,7 +150,7 @@ class Button:
         pygame.draw.rect(surface, self.bordercolor, pygame.Rect(0, 0, self.rect.width - 1, self.rect.height - 1), 2)
 
         # Text
-        txt, rect = regularfont.render(self.text, self.textcolor)
+        txt, rect = text_cache.render(regularfont, self.text, self.textcolor)
         surface.blit(txt, (surface.get_width() // 2 - rect.width // 2, 10))
 
         return surface
@@ -107,6 +187,14 @@ class TextBox:
         """
         return self.text
 
+    def state(self) -> Tuple:
+        """
+        Return everything the rendered text box depends on, see Button.state()
+
+        :return: a tuple of the state
+        """
+        return self.rect.size, self.text, self.active
+
     def render(self) -> pygame.Surface:
         """
         Return a surface containing the rendered text box
@@ -157,22 +245,43 @@ class Table:
     """
     A table which can store data entries and displays them.
     Has scrolling features and the ability to select entries and view more info.
+    Only the rows around the visible ones are rendered, so tables with tens of thousands of entries scroll smoothly.
     """
     def __init__(self, rect: pygame.Rect, scene: object) -> None:
         self.rect = rect
         self.entries = {}
+        # The entries in the order they are shown, and the position of each entry
+        self.order = []
+        self.positions = {}
         self.scroll = 0
         self.selected = None
         self.selectable = True
         self.scene = scene
+        # The rows around the visible ones are rendered once into a strip, which is only rendered again when
+        # the entries, the selection or the size change, or when scrolled past it. Every change to the entries
+        # gets a new version
+        self.version = 0
+        self.rows = {}
+        self.strip = None
+        self.stripkey = None
+        self.stripstart = 0
+        self.stripstop = 0
+        self.frame = None
+        self.framekey = None
 
     def add_entry(self, entry: data.Entry) -> None:
         """
-        Add a given entry to the table
+        Add a given entry to the table, an entry that is already in the table keeps its position
 
         :param entry: a new entry to add
         """
+        if entry in self.positions:
+            self.order[self.positions[entry]] = entry
+        else:
+            self.positions[entry] = len(self.order)
+            self.order.append(entry)
         self.entries[entry] = entry
+        self.version += 1
 
     def remove_entry(self, entry: data.Entry) -> None:
         """
@@ -181,12 +290,20 @@ class Table:
         :param entry: the entry to remove
         """
         del self.entries[entry]
+        position = self.positions.pop(entry)
+        del self.order[position]
+        for i in range(position, len(self.order)):
+            self.positions[self.order[i]] = i
+        self.version += 1
 
     def clear(self) -> None:
         """
         Removes all entries from the table
         """
         self.entries = {}
+        self.order = []
+        self.positions = {}
+        self.version += 1
 
     def get_selected(self) -> Union[data.Entry, None]:
         """
@@ -194,46 +311,139 @@ class Table:
 
         :return: a data entry
         """
-        if self.selected is None:
+        if self.selected is None or self.selected >= len(self.order):
             return None
-        return list(self.entries.values())[self.selected]
+        return self.order[self.selected]
+
+    def visible_rows(self) -> int:
+        """
+        Return the most rows that can be visible at once, partly visible rows included
+
+        :return: the amount of rows
+        """
+        return self.rect.height // 100 + 2
+
+    def state(self) -> Tuple:
+        """
+        Return everything the rendered table depends on, see Button.state()
+
+        :return: a tuple of the state
+        """
+        return self.version, self.selected, self.selectable, self.rect.size, self.scroll
 
     def render(self) -> pygame.Surface:
         """
-        Return a surface containing the rendered table
+        Return a surface containing the rendered table.
+        The same surface is returned for as long as nothing about the table changed
 
         :return: the table surface
         """
-        surface = pygame.Surface(self.rect.size)
+        stripkey = (self.version, self.selected, self.selectable, self.rect.size)
+        first = self.scroll // 100
+        # Whether the visible rows are all in the strip, or the strip reaches the last row
+        inside = self.stripstart <= first and (self.stripstop >= max(4, len(self.order))
+                                               or self.scroll + self.rect.height <= self.stripstop * 100)
+        if stripkey != self.stripkey or not inside:
+            self.strip = self.render_strip(first)
+            self.stripkey = stripkey
+        framekey = (stripkey, self.scroll)
+        if framekey != self.framekey:
+            self.frame = self.render_frame()
+            self.framekey = framekey
+        return self.frame
+
+    def row_key(self, i: int, entry: Union[data.Entry, None]) -> Tuple:
+        """
+        Return everything a rendered row depends on, to find the surface rendered for it before.
+        Entries are equal when their ids are, so the shown info is part of the key as well,
+        an entry added again with other info gets a new row
+
+        :param i: the position of the row
+        :param entry: the entry in the row, or None for an empty row
+        :return: a tuple of the state of the row
+        """
+        info = entry.basic_info() if entry is not None else {}
+        return (entry, info.get('title'), info.get('info'), i % 2, self.selectable and self.selected == i,
+                self.selectable, self.rect.width)
+
+    def render_row(self, i: int, entry: Union[data.Entry, None]) -> pygame.Surface:
+        """
+        Return a surface containing a single rendered row, reusing the surface rendered for the same row before
+
+        :param i: the position of the row
+        :param entry: the entry in the row, or None for an empty row
+        :return: the row surface
+        """
+        key = self.row_key(i, entry)
+        if key in self.rows:
+            return self.rows[key]
+        yellow = (255, 255, 0)
+        width = self.rect.width - 25
+        surface = pygame.Surface((width, 100))
+        surface.fill((40, 40, 40) if i % 2 == 0 else (30, 30, 30))
+
+        if entry is not None:
+            info = entry.basic_info()
+            text(surface, info['title'], (20, 20), regularfont, yellow)
+            text(surface, info['info'], (30, 45), smallfont, yellow)
+
+            # radio selectors
+            if self.selectable:
+                pygame.draw.rect(surface, yellow, pygame.Rect(self.rect.width - 100, 25, 50, 50), 2)
+                if self.selected == i:
+                    pygame.draw.circle(surface, yellow, (self.rect.width - 75, 50), 15, 3)
+
+                # info button
+                pygame.draw.rect(surface, yellow, pygame.Rect(self.rect.width - 175, 25, 50, 50), 2)
+                text(surface, "i", (self.rect.width - 160, 35), iconfont, yellow)
+
+        self.rows[key] = surface
+        return surface
+
+    def render_strip(self, first: int) -> pygame.Surface:
+        """
+        Return a surface containing the rows around the visible ones below each other, from a screen above to
+        a screen below, which the visible part is blitted from when scrolling.
+        Only rows that changed are rendered again, see render_row()
+
+        :param first: the first visible row
+        :return: the strip surface
+        """
+        visible = self.visible_rows()
+        total = max(4, len(self.order))
+        self.stripstart = max(0, min(first - visible, total - 3 * visible))
+        self.stripstop = min(total, self.stripstart + 3 * visible)
+        strip = pygame.Surface((self.rect.width - 25, (self.stripstop - self.stripstart) * 100))
+        previous, self.rows = self.rows, {}
+        for i in range(self.stripstart, self.stripstop):
+            entry = self.order[i] if i < len(self.order) else None
+            key = self.row_key(i, entry)
+            # Keep only the rows still in use
+            if key in previous:
+                self.rows[key] = previous[key]
+            strip.blit(self.render_row(i, entry), (0, (i - self.stripstart) * 100))
+        return strip
+
+    def render_frame(self) -> pygame.Surface:
+        """
+        Return a surface containing the visible part of the strip, the scroll bar and the borders
+
+        :return: the table surface
+        """
+        surface = self.frame if self.frame is not None and self.frame.get_size() == self.rect.size \
+            else pygame.Surface(self.rect.size)
+        surface.fill((0, 0, 0))
         yellow = (255, 255, 0)
         pygame.draw.rect(surface, (40, 40, 40), pygame.Rect(1, 1, self.rect.width - 2, self.rect.height - 2), 0)
 
         # Entries
-        for i in range(max(4, len(self.entries))):
-            color = (40, 40, 40) if i % 2 == 0 else (30, 30, 30)
-            rect = pygame.Rect(0, (i * 100) - self.scroll, self.rect.width - 25, 100)
-            pygame.draw.rect(surface, color, rect, 0)
-
-            if i < len(self.entries):
-                info = list(self.entries.values())[i].basic_info()
-                text(surface, info['title'], (20, rect.top + 20), regularfont, yellow)
-                text(surface, info['info'], (30, rect.top + 45), pygame.freetype.SysFont('Mono', 15), yellow)
-
-                # radio selectors
-                if self.selectable:
-                    pygame.draw.rect(surface, yellow, pygame.Rect(self.rect.width - 100, (i * 100) - self.scroll + 25, 50, 50), 2)
-                    if self.selected == i:
-                        pygame.draw.circle(surface, yellow, (self.rect.width - 75, (i * 100) - self.scroll + 50), 15, 3)
-
-                    # info button
-                    pygame.draw.rect(surface, yellow, pygame.Rect(self.rect.width - 175, (i * 100) - self.scroll + 25, 50, 50), 2)
-                    ifont = pygame.freetype.SysFont('Mono', 50)
-                    text(surface, "i", (self.rect.width - 160, (i * 100) - self.scroll + 35), ifont, yellow)
+        surface.blit(self.strip, (0, 0), pygame.Rect(0, self.scroll - self.stripstart * 100, self.strip.get_width(), self.rect.height))
 
         # Scroll bar
         barheight = min(1.0, (self.rect.height / 100) / max(1, len(self.entries)))  # height of the bar
         bartop = self.scroll / (max(1, len(self.entries)) * 100)  # distance from top
-        scrollrect = pygame.Rect(self.rect.width - 20, 5 + (self.rect.height * bartop), 15, (self.rect.height - 10) * barheight - 3)
+        # The bar keeps a size that can be grabbed, even for thousands of entries
+        scrollrect = pygame.Rect(self.rect.width - 20, 5 + (self.rect.height * bartop), 15, max(10, (self.rect.height - 10) * barheight - 3))
         pygame.draw.rect(surface, yellow, scrollrect, 0)
 
         pygame.draw.rect(surface, yellow, pygame.Rect(0, 0, self.rect.width - 1, self.rect.height - 1), 2)
@@ -263,12 +473,14 @@ class Table:
                     if pygame.Rect(self.rect.right - 25, self.rect.top, 25, self.rect.height).collidepoint(mousepos):
                         # Calculate how far the list must scroll so that the middle of the scroll bar lands
                         # where the mouse was clicked. The scroll bar cannot exceed its boundaries.
-                        barhalf = (min(1.0, 4 / max(1, len(self.entries))) * self.rect.height) / 2
+                        barhalf = max(5, (min(1.0, 4 / max(1, len(self.entries))) * self.rect.height) / 2)
                         relativemouse = min(max(0, mousepos[1] - self.rect.top - barhalf - 5), self.rect.height - (2 * barhalf))
                         span = abs((barhalf - 5) - (self.rect.height - barhalf - 5))
                         self.scroll = int((relativemouse / max(1, span)) * max(0, (len(self.entries) * 100) - self.rect.height))
                     elif self.selectable:
-                        for c, e in enumerate(self.entries):
+                        # Only the row under the mouse can have been clicked
+                        c = (mousepos[1] - self.rect.top + self.scroll) // 100
+                        if 0 <= c < len(self.order):
                             radiorect = pygame.Rect(self.rect.width - 100 + self.rect.left, (c * 100) - self.scroll + 25 + self.rect.top, 50, 50)
                             inforect = pygame.Rect(self.rect.width - 175 + self.rect.left, (c * 100) - self.scroll + 25 + self.rect.top, 50, 50)
                             if radiorect.collidepoint(mousepos):
@@ -277,7 +489,7 @@ class Table:
                                 else:
                                     self.selected = c
                             elif inforect.collidepoint(mousepos):
-                                self.scene.director.switch(scenes.InfoScene(e, self.scene))
+                                self.scene.director.switch(scenes.InfoScene(self.order[c], self.scene))
 
 
 class SearchBox:
@@ -295,15 +507,34 @@ class SearchBox:
         # Searchtype dictates whether the searchbox searches for movies or people, defaulting to movies if unknown
         # modes are entered.
         self.searchtype = "person" if searchtype.lower() == "person" else "movie"
+        # Every search gets a new generation, results of older generations are thrown away
+        self.generation = 0
+        self.results = queue.SimpleQueue()
+        # The latest search of IMDbPy, cancelled when a newer one is started before it ran
+        self.future = None
+        # The text the table shows local results for, and when to search IMDbPy if nothing was found locally
+        self.typed = ""
+        self.fallback = None
 
     def handle_events(self, events: List[object]) -> None:
+        self.receive()
+
         mousepos = pygame.mouse.get_pos()
         relativemouse = (mousepos[0] - self.rect.left, mousepos[1] - self.rect.top)
 
         self.inputbar.handle_events(events, relativemouse)
+        self.suggest()
         self.searchbutton.handle_events(events, relativemouse)
         self.outputtable.handle_events(events, relativemouse)
 
+    def state(self) -> Tuple:
+        """
+        Return everything the rendered search box depends on, see Button.state()
+
+        :return: a tuple of the state
+        """
+        return self.rect.size, self.inputbar.state(), self.searchbutton.state(), self.outputtable.state()
+
     def render(self) -> pygame.Surface:
         """
         Return a surface containing the rendered search box
@@ -333,12 +564,90 @@ class SearchBox:
 
     def search(self, query: str) -> None:
         """
-        Fill the table with search results from parsing the string into IMDbPy
+        Start filling the table with search results from parsing the string into IMDbPy.
+        The search runs on a worker thread and cancels any earlier search, see receive()
 
         :param query: the queried string
         """
-        results = data.search_person(query, 10) if self.searchtype == "person" else data.search_movie(query, 10)
+        self.cancel()
+        self.fallback = None
+        self.clear_results()
+        self.searchbutton.text = "..."
+        self.future = search_pool.submit(self.run_search, self.generation, query)
+
+    def suggest(self) -> None:
+        """
+        Fill the table with the titles or names the app has seen matching the text, whenever the text changed.
+        When nothing matches, IMDbPy is searched once the text stayed unchanged for FALLBACK_DELAY seconds
+        """
+        query = self.inputbar.get_text()
+        if query != self.typed:
+            self.typed = query
+            # Results of a search still running are for an older text
+            self.cancel()
+            self.searchbutton.text = "search"
+            self.clear_results()
+            if self.searchtype == "person":
+                results = data.instant_search_person(query, 10)
+            else:
+                results = data.instant_search_movie(query, 10)
+            for entry in results:
+                self.outputtable.add_entry(entry)
+            self.fallback = time.monotonic() + FALLBACK_DELAY if not results and len(query.strip()) >= 3 else None
+        elif self.fallback is not None and time.monotonic() >= self.fallback:
+            self.search(query)
+
+    def cancel(self) -> None:
+        """
+        Start a new generation, so results of earlier searches are thrown away.
+        A search of IMDbPy still waiting for a worker is cancelled, one already running stops at its next result
+        """
+        self.generation += 1
+        if self.future is not None:
+            self.future.cancel()
+
+    def clear_results(self) -> None:
+        """
+        Remove all results from the table
+        """
         self.outputtable.clear()
         self.outputtable.selected = None
         self.outputtable.scroll = 0
-        _ = [self.outputtable.add_entry(entry) for entry in results]
+
+    def run_search(self, generation: int, query: str) -> None:
+        """
+        Search IMDbPy and pass every result on as soon as it is ready. Runs on a worker thread
+
+        :param generation: the generation of the search
+        :param query: the queried string
+        """
+        try:
+            if self.searchtype == "person":
+                results = data.iter_search_person(query, 10)
+            else:
+                results = data.iter_search_movie(query, 10)
+            for entry in results:
+                # Stop early when a newer search has been started
+                if generation != self.generation:
+                    return
+                self.results.put((generation, entry))
+        except Exception:
+            pass
+        finally:
+            self.results.put((generation, None))
+
+    def receive(self) -> None:
+        """
+        Add the search results that arrived since the last frame to the table
+        """
+        while True:
+            try:
+                generation, entry = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if generation != self.generation:
+                continue
+            if entry is None:
+                self.searchbutton.text = "search"
+            else:
+                self.outputtable.add_entry(entry)